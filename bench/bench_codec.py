@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*
+"""novelWriter Codec Benchmark
+
+ novelWriter – Codec Benchmark
+===============================
+ Times the paragraph codec and the text counts on generated documents
+
+ Usage: bench_codec.py [documents] [words per document]
+
+ File History:
+ Created: 2017-11-13 [0.4.0]
+
+"""
+
+import sys
+import random
+
+from os import path
+
+sys.path.insert(0,path.dirname(path.dirname(path.abspath(__file__))))
+
+from benchtools import makeDoc, timeBest
+from nw.codec   import decodePar, encodePar, plainText
+from nw.stats   import countText
+
+def runBench(nDocs, nWords):
+    
+    rndGen  = random.Random(42)
+    allDocs = [makeDoc(rndGen,nWords) for n in range(nDocs)]
+    allPars = [parItem for parText in allDocs for parItem in parText]
+    allRuns = [decodePar(parItem) for parItem in allPars]
+    sizeMB  = sum(len(parItem) for parItem in allPars)/1.0e6
+    
+    print("%d documents of %d words, %d paragraphs, %.1f MB" % (nDocs,nWords,len(allPars),sizeMB))
+    print("")
+    print("%-10s %10s %14s %12s" % ("Function","MB/s","Paragraphs/s","Documents/s"))
+    
+    theBench = [
+        ("decodePar", lambda: [decodePar(parItem) for parItem in allPars]),
+        ("encodePar", lambda: [encodePar(parRuns) for parRuns in allRuns]),
+        ("plainText", lambda: [plainText(parItem) for parItem in allPars]),
+        ("countText", lambda: [countText(parText) for parText in allDocs]),
+    ]
+    for benchName, benchFunc in theBench:
+        runTime = timeBest(benchFunc)
+        print("%-10s %10.1f %14.0f %12.0f" % (
+            benchName,sizeMB/runTime,len(allPars)/runTime,nDocs/runTime
+        ))
+    
+    roundTrip = all(decodePar(encodePar(parRuns)) == parRuns for parRuns in allRuns)
+    print("")
+    print("Round trip of all paragraphs: %s" % ("OK" if roundTrip else "FAILED"))
+    
+    return 0 if roundTrip else 1
+
+if __name__ == "__main__":
+    nDocs  = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    nWords = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    sys.exit(runBench(nDocs,nWords))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*
+"""novelWriter Compression Benchmark
+
+ novelWriter – Compression Benchmark
+=====================================
+ Compares the disk size and the open and save times of the documents of the sample project,
+ scaled up, when written with each of the document compressions
+
+ Usage: bench_compression.py [scenes] [paragraphs per scene]
+
+ File History:
+ Created: 2017-11-10 [0.4.0]
+
+"""
+
+import sys
+import shutil
+import logging
+import tempfile
+
+from os   import path, listdir
+from time import perf_counter
+
+repoRoot = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0,repoRoot)
+
+from nw.file import Book, BookItem, DocFile
+
+def sceneDocs(theBook):
+    """
+    Returns the documents of the scenes in the project, in tree order.
+    """
+    
+    docItems = []
+    for itemHandle in theBook.theTree.treeOrder:
+        treeItem = theBook.getItem(itemHandle)
+        if treeItem["entry"].itemClass == BookItem.CLS_SCENE and treeItem["doc"] is not None:
+            docItems.append(treeItem["doc"])
+    
+    return docItems
+
+def makeProject(projDir, nScenes, nPars):
+    """
+    Copies the sample project into projDir, and adds nScenes scenes to it in chapters of ten.
+    Each new scene holds nPars paragraphs, taken in turn from the scenes of the sample project.
+    Returns the path to the project file.
+    """
+    
+    bookPath = path.join(projDir,"SampleBookProject.nwx")
+    shutil.copy(path.join(repoRoot,"sample","SampleBookProject.nwx"),bookPath)
+    shutil.copytree(
+        path.join(repoRoot,"sample","SampleBookProject.nwd"),
+        path.join(projDir,"SampleBookProject.nwd")
+    )
+    
+    theBook = Book()
+    theBook.openBook(bookPath)
+    samplePars = []
+    for docItem in sceneDocs(theBook):
+        samplePars += [parItem for parItem in docItem.docText[DocFile.VAL_TEXT] if parItem != ""]
+    
+    theTree = theBook.theTree
+    for scIdx in range(nScenes):
+        if scIdx % 10 == 0:
+            theBook.addChapter()
+            chHandle = theTree.parOfItems[theTree.fixedItems[BookItem.TYP_BOOK]].getLast()
+        theBook.addFile(chHandle)
+        docItem = theBook.getItem(theTree.parOfFiles[chHandle].getLast())["doc"]
+        docItem.setText([samplePars[(7*scIdx+n) % len(samplePars)] for n in range(nPars)],[nPars])
+        docItem.saveFile()
+    
+    theBook.saveBook()
+    theBook.closeBook()
+    
+    return bookPath
+
+def timeProject(bookPath, docCompress):
+    """
+    Converts the documents of the project to docCompress, and returns the size of the document
+    folder in bytes, the time to write each document, and the time to read each document when
+    the project is opened again. Also returns the text read back.
+    """
+    
+    theBook = Book()
+    theBook.openBook(bookPath)
+    docItems = sceneDocs(theBook)
+    for docItem in docItems:
+        docItem.docText
+    
+    startTime = perf_counter()
+    theBook.convertDocs(docCompress)
+    saveTime  = (perf_counter() - startTime)/len(docItems)
+    theBook.saveBook()
+    
+    docPath  = theBook.docPath
+    diskSize = sum(path.getsize(path.join(docPath,docFile)) for docFile in listdir(docPath))
+    theBook.closeBook()
+    
+    theBook = Book()
+    theBook.openBook(bookPath)
+    docItems  = sceneDocs(theBook)
+    startTime = perf_counter()
+    for docItem in docItems:
+        docItem.docText
+    openTime  = (perf_counter() - startTime)/len(docItems)
+    docTexts  = [docItem.docText[DocFile.VAL_TEXT] for docItem in docItems]
+    theBook.closeBook()
+    
+    return diskSize, saveTime, openTime, docTexts
+
+def runBench(nScenes, nPars):
+    
+    logging.getLogger().setLevel(logging.WARN)
+    
+    tmpDir   = tempfile.TemporaryDirectory()
+    bookPath = makeProject(tmpDir.name,nScenes,nPars)
+    
+    # The project is written uncompressed when it is made, so the documents are converted to
+    # the other compressions first, as a document that already has the right compression isn't
+    # written again
+    theBench = {}
+    for docCompress in (DocFile.CMP_GZIP,DocFile.CMP_LZMA,DocFile.CMP_NONE):
+        theBench[docCompress] = timeProject(bookPath,docCompress)
+    tmpDir.cleanup()
+    
+    print("Sample project with %d more scenes of %d paragraphs" % (nScenes,nPars))
+    print("")
+    print("%-12s %10s %14s %14s" % ("Compression","Size","Open","Save"))
+    for docCompress in DocFile.validCompress:
+        diskSize, saveTime, openTime, docTexts = theBench[docCompress]
+        print("%-12s %7.0f kB %8.2f ms/doc %8.2f ms/doc" % (
+            docCompress,diskSize/1024,1000*openTime,1000*saveTime
+        ))
+    
+    sameText = all(
+        theBench[docCompress][3] == theBench[DocFile.CMP_NONE][3] for docCompress in DocFile.validCompress
+    )
+    print("")
+    print("Same text read back with each compression: %s" % ("OK" if sameText else "FAILED"))
+    
+    return 0 if sameText else 1
+
+if __name__ == "__main__":
+    nScenes = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    nPars   = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    sys.exit(runBench(nScenes,nPars))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*
+"""novelWriter Logging Benchmark
+
+ novelWriter – Logging Benchmark
+=================================
+ Times encodeText on a generated scene and sortTree on a generated tree with logging at WARN,
+ where the logging calls in them should cost close to nothing. If a git revision is given,
+ the same is timed on the code at that revision, to compare with.
+
+ Usage: bench_logging.py [words] [entries] [revision]
+
+ File History:
+ Created: 2017-11-08 [0.4.0]
+
+"""
+
+import sys
+import random
+import hashlib
+import tarfile
+import tempfile
+import subprocess
+
+from os import path
+
+repoRoot = path.dirname(path.dirname(path.abspath(__file__)))
+
+from benchtools import makeDoc, timeBest
+
+def timeSort(nEntries):
+    """
+    Returns the time of sortTree on a tree of 400 chapters holding nEntries scenes in all. No
+    document files are written.
+    """
+    
+    from nw.file.item import BookItem
+    from nw.file.tree import BookTree
+    
+    theTree = BookTree()
+    theTree.setPath(tempfile.gettempdir())
+    for rootType in list(theTree.fixedItems.keys()):
+        theTree.createRootItem(rootType)
+    theTree.sortTree()
+    with theTree.batch():
+        for chIdx in range(400):
+            theTree.addChapter()
+        chHandles = list(theTree.parOfItems[theTree.fixedItems[BookItem.TYP_BOOK]])
+        for itemIdx in range(nEntries):
+            theTree.addFile(chHandles[itemIdx % 400])
+    
+    return timeBest(theTree.sortTree,5)
+
+def timeEncode(nWords):
+    """
+    Returns the time of encodeText on a scene of nWords words, and a hash of its output, or
+    None if GtkSource is not available.
+    """
+    
+    try:
+        import gi
+        gi.require_version("Gtk","3.0")
+        gi.require_version("GtkSource","3.0")
+        from nw.gui.textbuffer import NWTextBuffer
+    except (ImportError,ValueError):
+        return None, None
+    
+    theBuffer = NWTextBuffer()
+    theBuffer.decodeText(makeDoc(random.Random(42),nWords))
+    encTime = timeBest(lambda: theBuffer.encodeText())
+    encHash = hashlib.md5("\n".join(theBuffer.encodeText()[0]).encode("utf-8")).hexdigest()
+    
+    return encTime, encHash
+
+def runTree(treePath, nWords, nEntries):
+    """
+    Runs the timings on the code in treePath in a new process, so that the code of two trees
+    can be compared. Returns the times, and the hash of the encoded text.
+    """
+    
+    runCode = (
+        "import sys, logging; sys.path[:0] = [%r,%r]\n"
+        "logging.getLogger().setLevel(logging.WARN)\n"
+        "import bench_logging as b\n"
+        "encTime, encHash = b.timeEncode(%d)\n"
+        "print(b.timeSort(%d), encTime, encHash)\n"
+    ) % (treePath,path.dirname(path.abspath(__file__)),nWords,nEntries)
+    runOut = subprocess.check_output([sys.executable,"-c",runCode]).decode("utf-8").split()
+    
+    sortTime = float(runOut[0])
+    encTime  = None if runOut[1] == "None" else float(runOut[1])
+    
+    return sortTime, encTime, runOut[2]
+
+def runBench(nWords, nEntries, gitRev=None):
+    
+    print("encodeText on %d words and sortTree on %d entries, logging at WARN" % (nWords,nEntries))
+    print("")
+    print("%-20s %12s %12s" % ("Code","sortTree","encodeText"))
+    
+    theRuns = [("This tree",repoRoot)]
+    tmpDir  = None
+    if gitRev is not None:
+        tmpDir  = tempfile.TemporaryDirectory()
+        gitData = subprocess.Popen(["git","-C",repoRoot,"archive",gitRev],stdout=subprocess.PIPE)
+        with tarfile.open(fileobj=gitData.stdout,mode="r|") as gitTar:
+            gitTar.extractall(tmpDir.name)
+        gitData.wait()
+        theRuns.insert(0,(gitRev,tmpDir.name))
+    
+    encHashes = []
+    for runName, treePath in theRuns:
+        sortTime, encTime, encHash = runTree(treePath,nWords,nEntries)
+        encText = "%10.3f s" % encTime if encTime is not None else "no GtkSource"
+        print("%-20s %10.4f s %12s" % (runName[:20],sortTime,encText))
+        encHashes.append(encHash)
+    
+    if tmpDir is not None:
+        tmpDir.cleanup()
+    
+    sameText = len(set(encHashes)) == 1
+    if len(theRuns) > 1 and encHashes[0] != "None":
+        print("")
+        print("Same encoded text from both: %s" % ("OK" if sameText else "FAILED"))
+    
+    return 0 if sameText else 1
+
+if __name__ == "__main__":
+    nWords   = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nEntries = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    gitRev   = sys.argv[3] if len(sys.argv) > 3 else None
+    sys.exit(runBench(nWords,nEntries,gitRev))
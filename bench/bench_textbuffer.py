@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*
+"""novelWriter Text Buffer Benchmark
+
+ novelWriter – Text Buffer Benchmark
+=====================================
+ Times encoding and decoding of the editor text buffer on a generated document, and compares
+ encodeText with the encoder it replaced
+
+ Usage: bench_textbuffer.py [words]
+
+ File History:
+ Created: 2017-11-13 [0.4.0]
+
+"""
+
+import sys
+import random
+
+from os   import path
+from time import perf_counter
+
+sys.path.insert(0,path.dirname(path.dirname(path.abspath(__file__))))
+
+from benchtools import makeDoc, timeBest
+from nw.codec   import escapeText
+
+def encodeByChar(theBuffer):
+    """
+    The encoder as it was before it was made to jump between tag toggles and line ends. It
+    steps through the buffer one character at a time, and is kept here to show the speedup,
+    and to check that the output is the same.
+    """
+    
+    parText   = []
+    textCount = [0,0,0]
+    parBuffer = ""
+    tagStack  = []
+    itCurr    = theBuffer.get_start_iter()
+    while True:
+        if itCurr.starts_tag():
+            for startTag in itCurr.get_tags():
+                tagName = startTag.get_property("name")
+                if tagName in theBuffer.mapEnc.keys() and not tagName in tagStack:
+                    tagStack.append(tagName)
+                    parBuffer += "<%s>" % theBuffer.mapEnc[tagName][0]
+        
+        for tagName in reversed(tagStack.copy()):
+            if itCurr.ends_tag(theBuffer.mapEnc[tagName][1]):
+                parBuffer += "</%s>" % theBuffer.mapEnc[tagName][0]
+                tagStack.remove(tagName)
+        
+        parBuffer += escapeText(itCurr.get_char())
+        
+        if itCurr.ends_line() or itCurr.is_end():
+            textCount[0] += 1
+            parBuffer = parBuffer.rstrip("\n")
+            for tagName in reversed(tagStack):
+                parBuffer += "</%s>" % theBuffer.mapEnc[tagName][0]
+            parText.append(parBuffer)
+            parBuffer = ""
+            for tagName in tagStack:
+                parBuffer += "<%s>" % theBuffer.mapEnc[tagName][0]
+        
+        if itCurr.ends_sentence(): textCount[1] += 1
+        if itCurr.ends_word():     textCount[2] += 1
+        
+        if itCurr.is_end():
+            break
+        else:
+            itCurr.forward_char()
+    
+    return parText, textCount
+
+def runBench(theBuffer, nWords):
+    
+    parText = makeDoc(random.Random(42),nWords)
+    
+    startTime = perf_counter()
+    theBuffer.decodeText(parText)
+    timeDecode = perf_counter() - startTime
+    
+    timeChar = timeBest(lambda: encodeByChar(theBuffer),1)
+    charText = encodeByChar(theBuffer)[0]
+    
+    # The buffer keeps the encoded lines until they are edited, so the first encoding after
+    # decoding does all the work, and the next only checks the cache
+    startTime = perf_counter()
+    fullText  = theBuffer.encodeText()[0]
+    timeFull  = perf_counter() - startTime
+    timeCache = timeBest(lambda: theBuffer.encodeText())
+    
+    midLine = theBuffer.get_line_count()//2
+    theBuffer.insert(theBuffer.get_iter_at_line(midLine),"edit ")
+    startTime = perf_counter()
+    editText  = theBuffer.encodeText()[0]
+    timeEdit  = perf_counter() - startTime
+    sameText  = fullText == charText and editText == encodeByChar(theBuffer)[0]
+    
+    print("%d words, %d paragraphs, %d characters" % (
+        nWords,len(parText),theBuffer.get_char_count()
+    ))
+    print("")
+    print("%-30s %10.4f s" % ("decodeText",timeDecode))
+    print("%-30s %10.4f s" % ("Encode one char at a time",timeChar))
+    print("%-30s %10.4f s  %6.1fx" % ("encodeText, first",timeFull,timeChar/timeFull))
+    print("%-30s %10.4f s" % ("encodeText, unchanged",timeCache))
+    print("%-30s %10.4f s" % ("encodeText, after one edit",timeEdit))
+    print("")
+    print("Same output as one char at a time: %s" % ("OK" if sameText else "FAILED"))
+    
+    return 0 if sameText else 1
+
+if __name__ == "__main__":
+    import gi
+    gi.require_version("Gtk","3.0")
+    gi.require_version("GtkSource","3.0")
+    from nw.gui.textbuffer import NWTextBuffer
+    nWords = int(sys.argv[1]) if len(sys.argv) > 1 else 150000
+    sys.exit(runBench(NWTextBuffer(),nWords))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*
+"""novelWriter Tree Node Benchmark
+
+ novelWriter – Tree Node Benchmark
+===================================
+ Compares the memory use and lookup time of dictionaries and TreeNode records for the entries
+ of a generated book tree
+
+ Usage: bench_tree_nodes.py [entries]
+
+ File History:
+ Created: 2017-11-05 [0.4.0]
+
+"""
+
+import sys
+import random
+import tracemalloc
+
+from os import path
+
+sys.path.insert(0,path.dirname(path.dirname(path.abspath(__file__))))
+
+from benchtools   import timeBest
+from nw.file.node import TreeNode
+
+def makeDict(tHandle, pHandle, tOrder, bookItem, docItem):
+    return {
+        "handle" : tHandle,
+        "parent" : pHandle,
+        "order"  : tOrder,
+        "entry"  : bookItem,
+        "doc"    : docItem,
+    }
+
+def makeTree(makeNode, nItems):
+    """
+    Returns nItems entries made by makeNode, with handles like those made by BookTree. Every
+    51st entry is a chapter under the root entry, and the others are scenes in the last
+    chapter. The entries have no item or document, so only the records and handles count.
+    """
+    
+    rndGen   = random.Random(42)
+    rootNode = makeNode("%013x" % rndGen.getrandbits(52),None,0,None,None)
+    theTree  = [rootNode]
+    parNode  = rootNode
+    for itemIdx in range(1,nItems):
+        tHandle = "%013x" % rndGen.getrandbits(52)
+        if itemIdx % 51 == 1:
+            theNode = makeNode(tHandle,rootNode["handle"],itemIdx,None,None)
+            parNode = theNode
+        else:
+            theNode = makeNode(tHandle,parNode["handle"],itemIdx,None,None)
+        theTree.append(theNode)
+    
+    return theTree
+
+def measureTree(makeNode, nItems):
+    """
+    Returns the tree made by makeTree, and the memory it holds in bytes.
+    """
+    
+    tracemalloc.start()
+    theTree = makeTree(makeNode,nItems)
+    memSize = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    
+    return theTree, memSize
+
+def timeLookup(theTree, getValues):
+    """
+    Returns the time of one lookup in nanoseconds. getValues must look up a value in each node
+    of theTree in a list comprehension. The time of the same loop without the lookup is taken
+    off.
+    """
+    
+    loopTime = timeBest(lambda: [theNode for theNode in theTree],5)
+    runTime  = timeBest(lambda: getValues(theTree),5)
+    
+    return 1.0e9*(runTime - loopTime)/len(theTree)
+
+def runBench(nItems):
+    
+    dictTree, dictSize = measureTree(makeDict,nItems)
+    nodeTree, nodeSize = measureTree(TreeNode,nItems)
+    
+    print("%d entries" % nItems)
+    print("")
+    print("%-10s %10s %8s %18s %14s" % ("Record","Memory","B/entry","Attribute lookup","Key lookup"))
+    print("%-10s %7.1f MB %8.0f %18s %11.0f ns" % (
+        "dict",dictSize/1.0e6,dictSize/nItems,
+        "",timeLookup(dictTree,lambda theTree: [theNode["entry"] for theNode in theTree])
+    ))
+    print("%-10s %7.1f MB %8.0f %15.0f ns %11.0f ns" % (
+        "TreeNode",nodeSize/1.0e6,nodeSize/nItems,
+        timeLookup(nodeTree,lambda theTree: [theNode.entry for theNode in theTree]),
+        timeLookup(nodeTree,lambda theTree: [theNode["entry"] for theNode in theTree])
+    ))
+    
+    sameTree = all(
+        dictNode[theKey] == nodeNode[theKey]
+        for dictNode, nodeNode in zip(dictTree,nodeTree) for theKey in dictNode.keys()
+    )
+    print("")
+    print("Same values in both trees: %s" % ("OK" if sameTree else "FAILED"))
+    
+    return 0 if sameTree else 1
+
+if __name__ == "__main__":
+    nItems = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    sys.exit(runBench(nItems))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*
+"""novelWriter Benchmark Tools
+
+ novelWriter – Benchmark Tools
+===============================
+ Helper functions shared by the benchmark scripts
+
+ File History:
+ Created: 2017-11-05 [0.4.0]
+
+"""
+
+from time import perf_counter
+
+def timeBest(theFunc, nRepeat=3):
+    """
+    Returns the shortest time of nRepeat calls to theFunc, in seconds.
+    """
+    
+    bestTime = None
+    for n in range(nRepeat):
+        startTime = perf_counter()
+        theFunc()
+        runTime = perf_counter() - startTime
+        if bestTime is None or runTime < bestTime:
+            bestTime = runTime
+    
+    return bestTime
+
+def makeDoc(rndGen, nWords):
+    """
+    Returns a document of nWords words as stored paragraphs of about 120 words each, with a
+    sentence every 15 words, some styled words, and some escaped &, < and > symbols.
+    """
+    
+    styleTags = ["strong","em","mark","del"]
+    parText   = []
+    parWords  = []
+    for wordIdx in range(nWords):
+        theWord = "".join(rndGen.choice("abcdefghijklmnopqrstuvwxyz") for n in range(rndGen.randint(2,8)))
+        theRand = rndGen.random()
+        if theRand < 0.01:
+            theWord = "&lt;"+theWord+"&gt;"
+        elif theRand < 0.02:
+            theWord = theWord+" &amp;"
+        if wordIdx % 15 == 14:
+            theWord += "."
+        if rndGen.random() < 0.05:
+            styleTag = rndGen.choice(styleTags)
+            theWord  = "<%s>%s</%s>" % (styleTag,theWord,styleTag)
+        parWords.append(theWord)
+        if wordIdx % 120 == 119 or wordIdx == nWords-1:
+            parText.append(" ".join(parWords))
+            parWords = []
+    
+    return parText
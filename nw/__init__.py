@@ -13,14 +13,10 @@
 
 import logging
 import getopt
-import gi
 
-gi.require_version("Gtk","3.0")
-
-from gi.repository import Gtk
-from os            import path, remove, rename
-from nw.config     import Config
-from nw.main       import NovelWriter
+from os        import path, remove, rename
+from nw.config import Config
+from nw.file   import Book, BookPack
 
 __author__     = "Veronica Berglyd Olsen"
 __copyright__  = "Copyright 2016-2017, Veronica Berglyd Olsen"
@@ -63,6 +59,20 @@ def logVVerbose(self, message, *args, **kws):
 logging.Logger.verbose  = logVerbose
 logging.Logger.vverbose = logVVerbose
 
+# Hot path logging
+#  Arguments passed to logger.verbose(message, arg, ...) are only formatted into the message if
+#  the level is enabled, so don't format with % at the call site. In loops, check the level once
+#  before the loop with logger.isVerbose() or logger.isVVerbose(), and skip the logging calls
+#  altogether when it is off. This also skips building the arguments.
+
+def logIsVerbose(self):
+    return self.isEnabledFor(VERBOSE)
+def logIsVVerbose(self):
+    return self.isEnabledFor(VVERBOSE)
+
+logging.Logger.isVerbose  = logIsVerbose
+logging.Logger.isVVerbose = logIsVVerbose
+
 # Initiating logging
 logger = logging.getLogger(__name__)
 
@@ -92,6 +102,9 @@ def main(sysArgs):
         "version",
         "config=",
         "headless",
+        "compress=",
+        "pack",
+        "unpack",
     ]
     
     helpMsg = (
@@ -108,7 +121,20 @@ def main(sysArgs):
         " -t, --time      Shows time stamp in logging output. Adds milliseconds for verbose.\n"
         " -l, --logfile   Specify log file.\n"
         "     --config    Alternative config file.\n"
-        "     --headless  Do not display GUI. Useful for testing scripts.\n"
+        "     --headless  Do not display GUI. Useful for testing scripts. If followed by a\n"
+        "                 command and a project, the command is run on the project without\n"
+        "                 loading Gtk at all, and the program exits. Commands are:\n"
+        "                   stats <project>           Print the counts of the project.\n"
+        "                   validate <project>        Check the project and its documents.\n"
+        "                   export <project> <file>   Write the book to a plain text file.\n"
+        "                   reindex <project>         Rebuild the startup cache.\n"
+        "                   recount <project>         Count the text of all documents again.\n"
+        "     --compress  Rewrite the documents of the project given as argument with\n"
+        "                 compression none, gzip or lzma, and exit.\n"
+        "     --pack      Write the project file and documents given as first argument to\n"
+        "                 the single file pack given as second argument, and exit.\n"
+        "     --unpack    Write the pack given as first argument back out as the project\n"
+        "                 file given as second argument and its documents, and exit.\n"
     ).format(
         version   = __version__,
         status    = __status__,
@@ -125,6 +151,9 @@ def main(sysArgs):
     showTime   = False
     confPath   = None
     showGUI    = True
+    toCompress = None
+    toPack     = False
+    toUnpack   = False
     
     # Parse Options
     try:
@@ -170,6 +199,12 @@ def main(sysArgs):
             confPath = inArg
         elif inOpt in ("--headless"):
             showGUI = False
+        elif inOpt in ("--compress"):
+            toCompress = inArg
+        elif inOpt in ("--pack"):
+            toPack = True
+        elif inOpt in ("--unpack"):
+            toUnpack = True
     
     # Set Logging
     if showTime: debugStr = timeStr+debugStr
@@ -193,7 +228,42 @@ def main(sysArgs):
         logger.addHandler(cHandle)
     
     logger.setLevel(debugLevel)
-
+    
+    # Convert a project to another document compression without starting the GUI
+    if toCompress is not None:
+        if len(inArgs) != 1:
+            print(helpMsg)
+            exit(2)
+        theBook = Book()
+        theBook.openBook(inArgs[0])
+        if not theBook.bookLoaded:
+            exit(1)
+        if theBook.convertDocs(toCompress) < 0:
+            exit(2)
+        theBook.saveBook()
+        exit()
+    
+    # Convert a project between the folder layout and a single file pack
+    if toPack or toUnpack:
+        if len(inArgs) != 2:
+            print(helpMsg)
+            exit(2)
+        if toPack:
+            BookPack(inArgs[1]).packBook(inArgs[0])
+        elif BookPack(inArgs[0]).unpackBook(inArgs[1]) < 0:
+            exit(1)
+        exit()
+    
+    # Run a batch command on a project, without importing Gtk
+    if not showGUI and len(inArgs) > 0:
+        from nw.headless import NovelHeadless
+        exit(NovelHeadless(confPath).runCommand(inArgs[0],inArgs[1:]))
+    
+    import gi
+    gi.require_version("Gtk","3.0")
+    from gi.repository import Gtk
+    from nw.main       import NovelWriter
+    
     NovelWriter(confPath,showGUI)
     Gtk.main()
     
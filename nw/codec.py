@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*
+"""novelWriter Paragraph Codec
+
+ novelWriter – Paragraph Codec
+===============================
+ Converts between stored paragraphs and runs of styled text
+
+ File History:
+ Created: 2017-11-13 [0.4.0]
+
+"""
+
+import logging
+import re
+import nw
+
+logger = logging.getLogger(__name__)
+
+# The style tags a paragraph can hold, as html names
+validStyles = ["strong","em","mark","del"]
+validOpen   = {"<%s>" % styleName : styleName for styleName in validStyles}
+validClose  = {"</%s>" % styleName : styleName for styleName in validStyles}
+
+# Splits a paragraph into html tags and text. A tag starts at a < and ends at the next >, or
+# before the next <. A lone < or <> is text. Tags never run past a line break, so the same
+# holds when several paragraphs are joined by line breaks.
+reTokens = re.compile(r"<[^<>\n]*>?|[^<]+")
+reTags   = re.compile(r"<[^<>\n]+>|<[^<>\n]{2,}")
+
+def escapeText(theText):
+    """
+    Escapes the symbols that have a meaning in a paragraph. The & goes first, so that the
+    other two aren't escaped twice.
+    """
+    if "&" in theText:
+        theText = theText.replace("&","&amp;")
+    if "<" in theText:
+        theText = theText.replace("<","&lt;")
+    if ">" in theText:
+        theText = theText.replace(">","&gt;")
+    return theText
+
+def unescapeText(theText):
+    """
+    Reverses escapeText. The &amp; goes last, so that an escaped &lt; is left as the text
+    &lt;. A & that doesn't start one of the three is left as it is, as in paragraphs saved
+    before the & was escaped.
+    """
+    if "&" in theText:
+        theText = theText.replace("&lt;","<")
+        theText = theText.replace("&gt;",">")
+        theText = theText.replace("&amp;","&")
+    return theText
+
+def plainText(parItem):
+    """
+    Returns the text of a paragraph, or of several joined by line breaks, without any tags.
+    """
+    if "<" in parItem:
+        parItem = reTags.sub("",parItem)
+    return unescapeText(parItem)
+
+def decodePar(parItem):
+    """
+    Decodes a stored paragraph into a list of runs of text, each with a tuple of the styles
+    that apply to it, in the order of validStyles. Next to each other, runs never have the
+    same styles, and no run is empty. A tag that closes a style that isn't open, or opens one
+    that already is, is ignored, as are unknown tags. Styles left open at the end of the
+    paragraph are closed there.
+    """
+    
+    parRuns  = []
+    tagStack = []
+    runStyle = ()
+    for theToken in reTokens.findall(parItem):
+        
+        if len(theToken) > 2 and theToken[0] == "<":
+            if theToken[1] == "/":
+                styleName = validClose.get(theToken)
+                if styleName in tagStack:
+                    tagStack.remove(styleName)
+                    runStyle = tuple(s for s in validStyles if s in tagStack)
+            else:
+                styleName = validOpen.get(theToken)
+                if styleName is not None and not styleName in tagStack:
+                    tagStack.append(styleName)
+                    runStyle = tuple(s for s in validStyles if s in tagStack)
+            continue
+        
+        theToken = unescapeText(theToken)
+        if len(parRuns) > 0 and parRuns[-1][1] == runStyle:
+            parRuns[-1] = (parRuns[-1][0]+theToken,runStyle)
+        else:
+            parRuns.append((theToken,runStyle))
+    
+    return parRuns
+
+def encodePar(parRuns):
+    """
+    Encodes a list of runs of text, each with a tuple of styles, as a stored paragraph. At the
+    start of each run, the open styles it doesn't have are closed, along with any opened after
+    them, and the styles it has that aren't open are opened in the order given. So the tags
+    are always properly nested, and decodePar returns the same runs, merged where they meet
+    with the same styles, and with the styles in the order of validStyles.
+    """
+    
+    parBuffer = []
+    tagStack  = []
+    for runText, runStyle in parRuns:
+        if len(runText) == 0:
+            continue
+        
+        for stackIdx, styleName in enumerate(tagStack):
+            if not styleName in runStyle:
+                for closeName in reversed(tagStack[stackIdx:]):
+                    parBuffer.append("</%s>" % closeName)
+                del tagStack[stackIdx:]
+                break
+        
+        for styleName in runStyle:
+            if not styleName in tagStack:
+                tagStack.append(styleName)
+                parBuffer.append("<%s>" % styleName)
+        
+        parBuffer.append(escapeText(runText))
+    
+    for closeName in reversed(tagStack):
+        parBuffer.append("</%s>" % closeName)
+    
+    return "".join(parBuffer)
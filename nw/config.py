@@ -13,12 +13,9 @@
 import logging
 import configparser
 import nw
-import gi
-gi.require_version("Gtk","3.0")
 
-from gi.repository import Gtk
-from os            import path, mkdir, getcwd
-from appdirs       import user_config_dir
+from os      import path, mkdir, getcwd
+from appdirs import user_config_dir
 
 logger = logging.getLogger(__name__)
 
@@ -76,6 +73,9 @@ class Config:
         self.spellCheck  = "en_GB"
         self.spellState  = False
         
+        ## Project
+        self.docCache    = 64          # MB of document text kept in memory
+        
         ## Paths
         self.recentBook  = [""]*10
         
@@ -135,6 +135,12 @@ class Config:
                     confParser.get(cnfSec,"parmargin"), 2, self.parMargin
                 )
         
+        ## Project
+        cnfSec = "Project"
+        if confParser.has_section(cnfSec):
+            if confParser.has_option(cnfSec,"doccache"):
+                self.docCache = confParser.getint(cnfSec,"doccache")
+        
         ## Path
         cnfSec = "Path"
         if confParser.has_section(cnfSec):
@@ -167,6 +173,11 @@ class Config:
         confParser.set(cnfSec,"textindent", self.packList(self.textIndent))
         confParser.set(cnfSec,"parmargin",  self.packList(self.parMargin))
         
+        ## Project
+        cnfSec = "Project"
+        confParser.add_section(cnfSec)
+        confParser.set(cnfSec,"doccache", str(self.docCache))
+        
         ## Path
         cnfSec = "Path"
         confParser.add_section(cnfSec)
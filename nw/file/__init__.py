@@ -16,7 +16,9 @@ import nw
 from nw.file.book import Book
 from nw.file.item import BookItem
 from nw.file.tree import BookTree
+from nw.file.node import TreeNode
 from nw.file.doc  import DocFile
+from nw.file.pack import BookPack
 
 logger = logging.getLogger(__name__)
 
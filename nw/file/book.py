@@ -14,25 +14,37 @@ import logging
 import nw
 import lxml.etree as ET
 
-from os           import path, mkdir
-from nw.file.item import BookItem
-from nw.file.tree import BookTree
-from nw.file.doc  import DocFile
-from nw.functions import getTimeStamp
+from os                 import path, mkdir
+from io                 import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from nw.file.item       import BookItem
+from nw.file.tree       import BookTree
+from nw.file.doc        import DocFile
+from nw.file.cache      import BookCache
+from nw.file.pack       import BookPack
+from nw.functions       import getTimeStamp
+from nw.stats           import countText
 
 logger = logging.getLogger(__name__)
 
 class Book():
     
+    # Threads used when many documents are opened at once
+    DOC_WORKERS = 4
+    
     def __init__(self):
         """The main book project class holding the tree of all its items, and all the buffers for
         the currently opened files.
         ToDo: Add field for book status, i.e. draft, idea, final, etc. Maybe a date field too."""
         
         self.bookLoaded   = False
+        self.bookChanged  = False
         self.bookPath     = None
         self.docPath      = None
+        self.bookPack     = None
+        self.mainConf     = nw.CONFIG
         self.theTree      = BookTree()
+        self.theCache     = BookCache(self)
         
         # Book Settings
         self.bookTitle    = ""
@@ -44,8 +56,20 @@ class Book():
         self.addCharacter = self.theTree.addCharacter
         self.addPlot      = self.theTree.addPlot
         self.getItem      = self.theTree.getItem
+        self.deleteItem   = self.theTree.deleteItem
         self.updateItem   = self.theTree.updateItem
         self.changeOrder  = self.theTree.changeOrder
+        self.batch        = self.theTree.batch
+        self.addWatch     = self.theTree.addWatch
+        self.removeWatch  = self.theTree.removeWatch
+        self.pinDoc       = self.theTree.docCache.pinDoc
+        self.unpinDoc     = self.theTree.docCache.unpinDoc
+        
+        # Document text is dropped from memory when there is more of it than the set limit
+        self.theTree.docCache.setLimit(self.mainConf.docCache*1024*1024)
+        
+        # Any change to the tree or its items means the project file must be saved
+        self.theTree.addWatch(self.onTreeChange)
         
         return
     
@@ -56,12 +80,17 @@ class Book():
     def closeBook(self):
         
         logger.info("Closing book project")
+        self.saveJournals()
         logger.debug("Resetting all project variables")
         
         self.bookLoaded  = False
+        self.bookChanged = False
         self.bookPath    = None
         self.docPath     = None
         self.theTree.clearTree()
+        if self.bookPack is not None:
+            self.bookPack.closePack()
+            self.bookPack = None
         
         # Book Settings
         self.bookTitle   = ""
@@ -74,78 +103,146 @@ class Book():
         and let the BookItem class determine whether the data is each element makes sense or not.
         Since both the open and save functions just iterates through everything, redundant data
         could possibly pass in and out of the buffer, but this could be prevented by adding a
-        verify function in the BookItem class."""
+        verify function in the BookItem class.
+        A packed project, a .nwp file written by BookPack, is opened read only. The project file
+        and the documents are then read straight from the pack."""
         
         if not path.isfile(bookPath):
             logger.error("Path not found: %s" % bookPath)
             return
         
-        if bookPath[-4:] == ".nwx":
+        if bookPath[-4:] == ".nwp":
+            self.bookPack = BookPack(bookPath)
+            if not self.bookPack.openPack():
+                self.bookPack = None
+                return
+        
+        if bookPath[-4:] in (".nwx",".nwp"):
             self.docPath = bookPath[:-4]+".nwd"
-            self.theTree.setPath(self.docPath)
         
         self.bookPath = bookPath
         
-        nwXML = ET.parse(bookPath)
-        xRoot = nwXML.getroot()
+        # If the startup cache matches the project file, there is no need to parse it. A cache
+        # that fails half way may have left entries in the tree, so it is cleared again.
+        self.theTree.clearTree()
+        self.theTree.setPath(self.docPath)
+        if self.bookPack is None and self.theCache.loadCache():
+            self.bookLoaded  = True
+            self.bookChanged = False
+            return
+        self.theTree.clearTree()
+        self.theTree.setPath(self.docPath)
+        self.theTree.setPack(self.bookPack)
         
-        nwxRoot     = xRoot.tag
-        appVersion  = xRoot.attrib["appVersion"]
-        fileVersion = xRoot.attrib["fileVersion"]
+        # The file is read as a stream, and each item is added to the tree as soon as its element
+        # has been read. The element is then cleared, so only one item is kept in memory at a time.
+        if self.bookPack is None:
+            nwSource = bookPath
+        else:
+            nwSource = BytesIO(self.bookPack.readBook())
+        nwXML   = ET.iterparse(nwSource,events=("end",),tag=("book","item"))
+        hasRoot = False
+        try:
+            for xEvent, xElem in nwXML:
+                
+                # The root element is already there, with its attributes, when the first element
+                # below it has been read
+                if not hasRoot:
+                    if not self.checkRoot(xElem.getroottree().getroot()): return
+                    hasRoot = True
+                
+                if xElem.tag == "book":
+                    logger.debug("BookOpen: Found book data")
+                    for xItem in xElem:
+                        if xItem.text is None: continue
+                        if xItem.tag == "title":
+                            logger.verbose("BookOpen: Title is '%s'",xItem.text)
+                            self.bookTitle = xItem.text
+                        elif xItem.tag == "author":
+                            logger.verbose("BookOpen: Author: '%s'",xItem.text)
+                            self.bookAuthors.append(xItem.text)
+                        elif xItem.tag == "compression":
+                            logger.verbose("BookOpen: Compression is '%s'",xItem.text)
+                            self.setCompression(xItem.text)
+                
+                elif xElem.tag == "item":
+                    if xElem.getparent().tag != "content": continue
+                    self.parseItem(xElem)
+                
+                # Drop the element, and the already parsed elements before it
+                xElem.clear()
+                while xElem.getprevious() is not None:
+                    del xElem.getparent()[0]
         
-        logger.verbose("BookOpen: XML root is %s" % nwxRoot)
-        logger.verbose("BookOpen: File version is %s" % fileVersion)
+        except ET.XMLSyntaxError as e:
+            logger.error("BookOpen: Failed to parse project file")
+            logger.error(str(e))
+            self.closeBook()
+            return
         
-        if not nwxRoot == "novelWriterXML" or not fileVersion == "1.0":
+        if not hasRoot:
             logger.error("BookOpen: Project file does not appear to be a novelWriterXML file version 1.0")
+            self.closeBook()
             return
         
-        for xChild in xRoot:
-            if xChild.tag == "book":
-                logger.debug("BookOpen: Found book data")
-                for xItem in xChild:
-                    if xItem.text is None: continue
-                    if xItem.tag == "title":
-                        logger.verbose("BookOpen: Title is '%s'" % xItem.text)
-                        self.bookTitle = xItem.text
-                    elif xItem.tag == "author":
-                        logger.verbose("BookOpen: Author: '%s'" % xItem.text)
-                        self.bookAuthors.append(xItem.text)
-            elif xChild.tag == "content":
-                logger.debug("BookOpen: Found book content")
-                for xItem in xChild:
-                    itemAttrib = xItem.attrib
-                    if "handle" in xItem.attrib:
-                        itemHandle = itemAttrib["handle"]
-                    else:
-                        logger.error("BookOpen: Entry missing handle, Skipping")
-                        continue
-                    if "parent" in xItem.attrib:
-                        itemParent = itemAttrib["parent"]
-                    else:
-                        itemParent = None
-                    if "order" in xItem.attrib:
-                        itemOrder = itemAttrib["order"]
-                    else:
-                        itemOrder = None
-                    bookItem = BookItem()
-                    for xValue in xItem:
-                        if xValue.tag == "meta":
-                            for metaTag in xValue.attrib.keys():
-                                bookItem.setFromTag(metaTag,xValue.attrib[metaTag])
-                        elif xValue.tag == "scene":
-                            for xScene in xValue:
-                                if xScene.tag == "character":
-                                    bookItem.addSceneChar(xScene.text)
-                                if xScene.tag == "plot":
-                                    bookItem.addScenePlot(xScene.text)
-                        else:
-                            bookItem.setFromTag(xValue.tag,xValue.text)
-                    self.theTree.appendItem(itemHandle,itemParent,itemOrder,bookItem)
-        
-        self.bookLoaded = True
+        self.bookLoaded  = True
         self.theTree.validateTree()
         self.theTree.sortTree()
+        self.bookChanged = False
+        if self.bookPack is None:
+            self.theCache.saveCache()
+        
+        return
+    
+    def checkRoot(self, xRoot):
+        
+        nwxRoot     = xRoot.tag
+        appVersion  = xRoot.attrib.get("appVersion")
+        fileVersion = xRoot.attrib.get("fileVersion")
+        
+        logger.verbose("BookOpen: XML root is %s",nwxRoot)
+        logger.verbose("BookOpen: File version is %s",fileVersion)
+        
+        if not nwxRoot == "novelWriterXML" or not fileVersion == "1.0":
+            logger.error("BookOpen: Project file does not appear to be a novelWriterXML file version 1.0")
+            return False
+        
+        return True
+    
+    def parseItem(self, xItem):
+        """Creates a BookItem from an item element of the project file, and appends it to the
+        tree."""
+        
+        itemAttrib = xItem.attrib
+        if "handle" in itemAttrib:
+            itemHandle = itemAttrib["handle"]
+        else:
+            logger.error("BookOpen: Entry missing handle, Skipping")
+            return
+        if "parent" in itemAttrib:
+            itemParent = itemAttrib["parent"]
+        else:
+            itemParent = None
+        if "order" in itemAttrib:
+            itemOrder = itemAttrib["order"]
+        else:
+            itemOrder = None
+        
+        bookItem = BookItem()
+        for xValue in xItem:
+            if xValue.tag == "meta":
+                for metaTag in xValue.attrib.keys():
+                    bookItem.setFromTag(metaTag,xValue.attrib[metaTag])
+            elif xValue.tag == "scene":
+                for xScene in xValue:
+                    if xScene.tag == "character":
+                        bookItem.addSceneChar(xScene.text)
+                    if xScene.tag == "plot":
+                        bookItem.addScenePlot(xScene.text)
+            else:
+                bookItem.setFromTag(xValue.tag,xValue.text)
+        
+        self.theTree.appendItem(itemHandle,itemParent,itemOrder,bookItem)
         
         return
     
@@ -154,8 +251,14 @@ class Book():
         tree. The items are saved in the order generated by sort function in the BookTree class.
         Root item are saved first, then container items, and lastly the file items. For robustness,
         this function will save anything found in the BookItem objects in the tree.
+        The file is only written if something has changed since it was opened or last saved.
+        Returns the number of bytes written.
         ToDo: Write to a temporary file and rename, rather than overwriting the current file."""
         
+        if self.bookPack is not None:
+            logger.error("BookSave: Packed projects are read only, unpack the project to save it")
+            return 0
+        
         bookDir  = path.dirname(self.bookPath)
         bookFile = path.basename(self.bookPath)
         logger.vverbose("BookSave: Folder is %s" % bookDir)
@@ -168,6 +271,11 @@ class Book():
                 logger.info("BookSave: Created folder %s" % self.docPath)
                 mkdir(self.docPath)
         
+        if not self.bookChanged and path.isfile(self.bookPath):
+            logger.debug("BookSave: No changes to the project file, skipping it")
+            self.theTree.purgeDeleted()
+            return 0
+        
         # Root element and book details
         nwXML = ET.Element("novelWriterXML",attrib={
             "fileVersion" : "1.0",
@@ -181,15 +289,20 @@ class Book():
             if bookAuthor is None or bookAuthor == "": continue
             xBookAuthor = ET.SubElement(xBook,"author")
             xBookAuthor.text = bookAuthor
+        if self.theTree.docCompress != DocFile.CMP_NONE:
+            xBookCompress = ET.SubElement(xBook,"compression")
+            xBookCompress.text = self.theTree.docCompress
         
         # Save all items in the tree in their created order
-        xContent = ET.SubElement(nwXML,"content",attrib={"count":str(len(self.theTree.theTree))})
+        self.theTree.refreshOrder()
+        xContent = ET.SubElement(nwXML,"content",attrib={"count":str(len(self.theTree.treeLookup))})
         itemIdx  = 0
         for treeItem in self.theTree.theTree:
             
-            itemHandle = str(treeItem["handle"])
-            parHandle  = str(treeItem["parent"])
-            itemOrder  = str(treeItem["order"])
+            if treeItem is None: continue
+            itemHandle = str(treeItem.handle)
+            parHandle  = str(treeItem.parent)
+            itemOrder  = str(treeItem.order)
             
             xItem = ET.SubElement(xContent,"item",attrib={
                 "handle" : str(itemHandle),
@@ -199,28 +312,29 @@ class Book():
             
             # Save the metadata of the file also in the project file
             # This means we don't need to load the file to list its wor count
-            fileMeta = {}
-            for metaTag in treeItem["entry"].validMeta:
-                metaValue = treeItem["entry"].getFromTag(metaTag)
+            itemEntry = treeItem.entry
+            fileMeta  = {}
+            for metaTag in itemEntry.validMeta:
+                metaValue = itemEntry.getFromTag(metaTag)
                 if not metaValue is None:
                     fileMeta[metaTag] = str(metaValue)
             if len(fileMeta) > 0:
                 xMeta = ET.SubElement(xItem,"meta",attrib=fileMeta)
             
             # Set all defined values (not None) in each item in the tree
-            for entryTag in treeItem["entry"].validTags:
-                entryValue = treeItem["entry"].getFromTag(entryTag)
+            for entryTag in itemEntry.validTags:
+                entryValue = itemEntry.getFromTag(entryTag)
                 if not entryValue is None:
                     xValue = ET.SubElement(xItem,entryTag)
                     xValue.text = str(entryValue)
             
             # Set scene items
-            if len(treeItem["entry"].sceneChars) + len(treeItem["entry"].scenePlots) > 0:
+            if len(itemEntry.sceneChars) + len(itemEntry.scenePlots) > 0:
                 xValue = ET.SubElement(xItem,"scene")
-                for sceneChar in treeItem["entry"].sceneChars:
+                for sceneChar in itemEntry.sceneChars:
                     xScene = ET.SubElement(xValue,"character")
                     xScene.text = str(sceneChar)
-                for scenePlot in treeItem["entry"].scenePlots:
+                for scenePlot in itemEntry.scenePlots:
                     xScene = ET.SubElement(xValue,"plot")
                     xScene.text = str(scenePlot)
             
@@ -228,14 +342,20 @@ class Book():
         
         # Write the xml tree to file
         with open(self.bookPath,"wb") as outFile:
-            outFile.write(ET.tostring(
+            byteCount = outFile.write(ET.tostring(
                 nwXML,
                 pretty_print    = True,
                 encoding        = "utf-8",
                 xml_declaration = True
             ))
+        self.bookChanged = False
+        self.theCache.saveCache()
+        logger.debug("BookSave: Wrote %d bytes to %s" % (byteCount,bookFile))
         
-        return True
+        # Now that the project file no longer lists them, remove files of deleted entries
+        self.theTree.purgeDeleted()
+        
+        return byteCount
     
     def createBook(self):
         
@@ -246,33 +366,158 @@ class Book():
         self.theTree.createRootItem(BookItem.TYP_PLOT)
         self.theTree.createRootItem(BookItem.TYP_NOTE)
         
-        self.bookTitle  = "New Book"
-        self.bookLoaded = True
+        self.bookTitle   = "New Book"
+        self.bookLoaded  = True
+        self.bookChanged = True
         self.theTree.validateTree()
         self.theTree.sortTree()
         
         return
     
+    #
+    #  Documents
+    #
+    
+    def openDocs(self, itemHandles=None, maxWorkers=DOC_WORKERS):
+        """Opens the documents of many entries, or of all entries, at once in a pool of
+        maxWorkers threads. Most of the time of an open is spent in the lxml parser, which releases
+        the GIL, so the documents are parsed in parallel. This is a generator yielding the handle
+        and DocFile of each document as soon as it has been read, so in no particular order.
+        Documents that are already in memory are yielded first, and documents that cannot be read
+        are logged and skipped. If the caller stops early, the documents that have not been
+        started yet are not read."""
+        
+        if itemHandles is None:
+            itemHandles = self.theTree.treeOrder
+        
+        # Documents that already have their text in memory are not read again, as that would
+        # replace any changes that haven't been saved
+        docItems = []
+        for itemHandle in itemHandles:
+            docItem = self.theTree.getItem(itemHandle)["doc"]
+            if docItem is None: continue
+            if docItem.textLoaded:
+                yield itemHandle, docItem
+            else:
+                docItems.append(docItem)
+        
+        logger.debug("BookOpen: Opening %d documents with %d threads" % (len(docItems),maxWorkers))
+        
+        docPool    = ThreadPoolExecutor(max_workers=maxWorkers)
+        docFutures = {}
+        try:
+            for docItem in docItems:
+                docFutures[docPool.submit(docItem.openFile)] = docItem
+            for docFuture in as_completed(docFutures):
+                docItem = docFutures[docFuture]
+                if docFuture.exception() is not None:
+                    logger.error("BookOpen: Failed to open document %s" % docItem.itemHandle)
+                    logger.error(str(docFuture.exception()))
+                    continue
+                yield docItem.itemHandle, docItem
+        finally:
+            for docFuture in docFutures.keys():
+                docFuture.cancel()
+            docPool.shutdown()
+        
+        return
+    
+    def saveJournals(self):
+        """Saves the documents in memory that have changes in a journal, which writes the
+        changes into their document files and removes the journals. Returns the number of
+        documents saved."""
+        
+        docCount = 0
+        for docItem in list(self.theTree.docCache.docItems.values()):
+            if docItem.hasJournal():
+                docItem.saveFile()
+                docCount += 1
+        
+        if docCount > 0:
+            logger.info("BookSave: Saved %d document(s) from their journals" % docCount)
+        
+        return docCount
+    
+    def convertDocs(self, docCompress):
+        """Sets the compression of the project's documents, and rewrites all existing document
+        files with it. The project file must be saved afterwards to keep the setting. Returns the
+        number of documents written, or -1 if the compression is not valid."""
+        
+        if not self.setCompression(docCompress): return -1
+        
+        docCount = 0
+        for itemHandle in self.theTree.treeOrder:
+            docItem = self.theTree.getItem(itemHandle)["doc"]
+            if docItem is None or not path.isfile(docItem.fullPath): continue
+            if docItem.saveFile() > 0:
+                docCount += 1
+        
+        logger.info("BookSave: Wrote %d document(s) with compression '%s'" % (docCount,docCompress))
+        
+        return docCount
+    
+    def recountDocs(self, itemHandles=None):
+        """Counts the text of the documents of many entries, or of all entries, and stores the
+        counts in the entries. Only counts that have changed are set, so the project is only
+        flagged as changed if any of them did. Returns the number of documents counted."""
+        
+        docCount = 0
+        with self.batch():
+            for itemHandle, docItem in self.openDocs(itemHandles):
+                itemEntry = self.theTree.getItem(itemHandle).entry
+                textCount = countText(docItem.docText[DocFile.VAL_TEXT])
+                for metaTag, metaValue in zip(BookItem.validMeta,textCount):
+                    if itemEntry.getFromTag(metaTag) != metaValue:
+                        self.updateItem(itemHandle,metaTag,metaValue)
+                docCount += 1
+        
+        logger.info("BookOpen: Counted the text of %d document(s)" % docCount)
+        
+        return docCount
+    
     #
     #  Set Functions
     #
     
     def setBookPath(self, bookPath):
-        self.bookPath = bookPath
+        if bookPath == self.bookPath: return
+        self.bookPath    = bookPath
+        self.bookChanged = True
         return
     
     def setTitle(self, bookTitle):
         if bookTitle.strip() == self.bookTitle: return
         logger.debug("Book title changed to '%s'" % bookTitle)
-        self.bookTitle = bookTitle.strip()
+        self.bookTitle   = bookTitle.strip()
+        self.bookChanged = True
         return
     
+    def setCompression(self, docCompress):
+        if docCompress not in DocFile.validCompress:
+            logger.error("Unknown document compression '%s'" % docCompress)
+            return False
+        if docCompress == self.theTree.docCompress: return True
+        logger.debug("Document compression changed to '%s'" % docCompress)
+        self.theTree.setCompression(docCompress)
+        self.bookChanged = True
+        return True
+    
     def setAuthors(self, bookAuthors):
+        authList = [author.strip() for author in bookAuthors.split(",")]
+        if authList == self.bookAuthors: return
         self.bookAuthors = []
-        authList = bookAuthors.split(",")
         for author in authList:
-            logger.debug("Book author '%s' added" % author.strip())
-            self.bookAuthors.append(author.strip())
+            logger.debug("Book author '%s' added" % author)
+            self.bookAuthors.append(author)
+        self.bookChanged = True
+        return
+    
+    #
+    #  Change Tracking
+    #
+    
+    def onTreeChange(self, changedHandles):
+        self.bookChanged = True
         return
     
 # End Class Book
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*
+"""novelWriter Book Cache Class
+
+ novelWriter – Book Cache Class
+================================
+ Binary startup cache of the project tree
+
+ File History:
+ Created: 2017-11-07 [0.4.0]
+
+"""
+
+import logging
+import marshal
+import nw
+
+from os           import path, stat
+from sys          import version_info
+from hashlib      import sha256
+from nw.file.item import BookItem
+
+logger = logging.getLogger(__name__)
+
+class BookCache():
+    
+    CACHE_MAGIC   = b"NWCACHE\x00"
+    CACHE_VERSION = 2
+    
+    def __init__(self, theBook):
+        """The cache is a file next to the project file holding the sorted tree, its indices and
+        the book settings, written with marshal. It is keyed by the size, modification time and
+        hash of the project file, and by the layout of BookItem, so a cache that doesn't match the
+        project file exactly is ignored, and the project file is parsed as usual."""
+        
+        self.theBook = theBook
+        
+        return
+    
+    def loadCache(self):
+        """Fills the book from the cache. Returns False if there is no valid cache, in which case
+        the book must be cleared and loaded from the project file."""
+        
+        cachePath = self.getCachePath()
+        if cachePath is None or not path.isfile(cachePath):
+            return False
+        
+        try:
+            with open(cachePath,"rb") as inFile:
+                if inFile.read(len(self.CACHE_MAGIC)) != self.CACHE_MAGIC:
+                    logger.debug("BookCache: Not a cache file, ignoring it")
+                    return False
+                cacheKey, cacheData = marshal.loads(inFile.read())
+            if cacheKey != self.getCacheKey():
+                logger.debug("BookCache: Cache is stale, ignoring it")
+                return False
+            bookTitle, bookAuthors, docCompress, packedTree = cacheData
+            self.theBook.theTree.setCompression(docCompress)
+            self.theBook.theTree.unpackTree(packedTree)
+        except Exception as e:
+            logger.warning("BookCache: Failed to read cache, ignoring it")
+            logger.warning(str(e))
+            return False
+        
+        self.theBook.bookTitle   = bookTitle
+        self.theBook.bookAuthors = bookAuthors
+        logger.debug("BookCache: Loaded %d entries from cache" % len(packedTree[0]))
+        
+        return True
+    
+    def saveCache(self):
+        """Writes the cache for the current state of the project file. This must be called right
+        after the project file has been read or written."""
+        
+        cachePath = self.getCachePath()
+        if cachePath is None: return False
+        
+        cacheData = (
+            self.theBook.bookTitle,
+            list(self.theBook.bookAuthors),
+            self.theBook.theTree.docCompress,
+            self.theBook.theTree.packTree(),
+        )
+        
+        try:
+            cacheKey = self.getCacheKey()
+            with open(cachePath,"wb") as outFile:
+                outFile.write(self.CACHE_MAGIC)
+                marshal.dump((cacheKey,cacheData),outFile)
+        except Exception as e:
+            logger.warning("BookCache: Failed to write cache")
+            logger.warning(str(e))
+            return False
+        
+        logger.debug("BookCache: Saved cache to %s" % cachePath)
+        
+        return True
+    
+    #
+    # Internal Functions
+    #
+    
+    def getCachePath(self):
+        bookPath = self.theBook.bookPath
+        if bookPath is None: return None
+        if bookPath[-4:] == ".nwx":
+            return bookPath[:-4]+".nwc"
+        return bookPath+".nwc"
+    
+    def getCacheKey(self):
+        """The key is checked in full, so any change to the project file, the cache format, the
+        Python version (which sets the marshal format), or the attributes of BookItem makes the
+        cache stale."""
+        
+        bookPath = self.theBook.bookPath
+        bookStat = stat(bookPath)
+        with open(bookPath,"rb") as inFile:
+            bookHash = sha256(inFile.read()).hexdigest()
+        
+        return (
+            self.CACHE_VERSION,
+            tuple(version_info[:2]),
+            tuple(BookItem.tagAttr.values()),
+            bookStat.st_size,
+            bookStat.st_mtime_ns,
+            bookHash,
+        )
+    
+# End Class BookCache
@@ -11,10 +11,17 @@
 """
 
 import logging
+import json
+import gzip
+import lzma
 import nw
 import lxml.etree as ET
 
-from os           import path
+from os           import path, remove, replace, fsync
+from io           import BytesIO
+from sys          import getsizeof
+from difflib      import SequenceMatcher
+from hashlib      import sha256
 from nw.content   import getLoremIpsum
 from nw.file.item import BookItem
 from nw.functions import getTimeStamp
@@ -33,19 +40,57 @@ class DocFile():
     CNT_WORD   = "wordcount"
     CNT_CHAR   = "charcount"
     
-    validEntry = [VAL_TEXT,VAL_NOTE,VAL_TIME,VAL_COUNT]
-    validCount = [CNT_PAR,CNT_SENT,CNT_WORD,CNT_CHAR]
+    CMP_NONE   = "none"
+    CMP_GZIP   = "gzip"
+    CMP_LZMA   = "lzma"
     
-    def __init__(self, docPath, itemHandle, itemClass):
+    validEntry    = [VAL_TEXT,VAL_NOTE,VAL_TIME,VAL_COUNT]
+    validCount    = [CNT_PAR,CNT_SENT,CNT_WORD,CNT_CHAR]
+    validCompress = [CMP_NONE,CMP_GZIP,CMP_LZMA]
+    
+    # Compressed files are recognised by their first bytes, so they keep the .nwf extension
+    MAGIC_GZIP = b"\x1f\x8b"
+    MAGIC_LZMA = b"\xfd7zXZ\x00"
+    
+    def __init__(self, docPath, itemHandle, itemClass, docCache=None, docCompress=CMP_NONE, docPack=None):
+        """The text of the document is read from disk the first time docText is used. If a
+        DocCache is given, the document reports to it when its text is read or changed, and the
+        cache may drop the text again with unloadFile to stay within its memory limit. The file
+        is written with docCompress compression, but is read whatever compression it has. If a
+        BookPack is given, the document and its journal are read from the pack instead of the
+        document folder, and the document is read only."""
         
-        self.itemHandle = itemHandle
-        self.itemClass  = itemClass
+        self.itemHandle  = itemHandle
+        self.itemClass   = itemClass
         
-        self.docPath    = docPath
-        self.docFile    = "%s-%s.nwf" % (self.itemClass,self.itemHandle)
-        self.fullPath   = path.join(self.docPath,self.docFile)
+        self.docPath     = docPath
+        self.docFile     = "%s-%s.nwf" % (self.itemClass,self.itemHandle)
+        self.fullPath    = path.join(self.docPath,self.docFile)
+        self.jrnlFile    = "%s-%s.nwj" % (self.itemClass,self.itemHandle)
+        self.jrnlPath    = path.join(self.docPath,self.jrnlFile)
         
-        self.docText = {
+        self.docCache     = docCache
+        self.textData     = self.emptyText()
+        self.textLoaded   = False
+        self.textChanged  = False
+        self.jrnlBase     = None
+        self.diskHash     = None
+        self.docCompress  = docCompress
+        self.diskCompress = None
+        self.docPack      = docPack
+        
+        return
+    
+    @property
+    def docText(self):
+        if not self.textLoaded:
+            self.openFile()
+        elif self.docCache is not None:
+            self.docCache.touchDoc(self)
+        return self.textData
+    
+    def emptyText(self):
+        return {
             self.VAL_TEXT  : [],
             self.VAL_NOTE  : [],
             self.VAL_TIME  : None,
@@ -56,16 +101,62 @@ class DocFile():
                 self.CNT_CHAR : None,
             }
         }
+    
+    def textSize(self):
+        """Returns the approximate memory used by the text and notes, in bytes."""
+        textSize = 0
+        for parItem in self.textData[self.VAL_TEXT]:
+            textSize += getsizeof(parItem)
+        for parItem in self.textData[self.VAL_NOTE]:
+            textSize += getsizeof(parItem)
+        return textSize
+    
+    def openFile(self):
+        """Reads the document from disk, replacing any text held in memory. Changes in the
+        journal that have not yet been saved to the document file are applied on top."""
+        
+        # The file is read into a new set of lists, so opening it again doesn't repeat the text,
+        # and a document without a file, or with a file that isn't valid, is left empty
+        docText = self.emptyText()
+        self.readFile(docText)
+        self.diskHash = self.hashText(docText)
+        jrnlCount = self.readJournal(docText)
+        
+        self.setLoaded(docText)
+        if jrnlCount > 0:
+            # The text differs from the document file until it is saved again
+            self.textChanged = True
         
         return
     
-    def openFile(self):
+    def readFile(self, docText):
+        """Reads the document file into docText. Returns False if there is no file, or it is
+        not a document file."""
         
-        if not path.isfile(self.fullPath):
+        if self.docPack is not None:
+            fileData = self.docPack.readFile(self.docFile)
+            if fileData is None:
+                logger.debug("File not found in pack %s" % self.docFile)
+                return False
+            docStream = BytesIO(fileData)
+        elif not path.isfile(self.fullPath):
             logger.debug("File not found %s" % self.fullPath)
-            return
+            return False
+        else:
+            docStream = open(self.fullPath,"rb")
         
-        nwXML = ET.parse(self.fullPath)
+        with docStream as inFile:
+            fileMagic = inFile.read(len(self.MAGIC_LZMA))
+            inFile.seek(0)
+            if fileMagic.startswith(self.MAGIC_GZIP):
+                self.diskCompress = self.CMP_GZIP
+                nwXML = ET.parse(gzip.GzipFile(fileobj=inFile,mode="rb"))
+            elif fileMagic.startswith(self.MAGIC_LZMA):
+                self.diskCompress = self.CMP_LZMA
+                nwXML = ET.parse(lzma.LZMAFile(inFile,mode="rb"))
+            else:
+                self.diskCompress = self.CMP_NONE
+                nwXML = ET.parse(inFile)
         xRoot = nwXML.getroot()
         
         nwxRoot = xRoot.tag
@@ -82,11 +173,11 @@ class DocFile():
         if "timeStamp" in xRoot.attrib.keys():
             timeStamp = xRoot.attrib["timeStamp"]
             logger.verbose("XML: File timestamp is %s" % timeStamp)
-            self.docText[self.VAL_TIME] = timeStamp
+            docText[self.VAL_TIME] = timeStamp
         
         if not nwxRoot == "novelWriterXML" or not fileVersion == "1.0":
             logger.error("DocOpen: Project file does not appear to be a novelWriterXML file version 1.0")
-            return
+            return False
         
         for xChild in xRoot:
             if xChild.tag == "document":
@@ -96,22 +187,40 @@ class DocFile():
                     if xItem.tag == self.VAL_COUNT:
                         for attribKey in xItem.attrib.keys():
                             if not attribKey in self.validCount: continue
-                            self.docText[self.VAL_COUNT][attribKey] = int(xItem.attrib[attribKey])
+                            docText[self.VAL_COUNT][attribKey] = int(xItem.attrib[attribKey])
                     elif xItem.tag == self.VAL_TEXT:
                         for xPar in xItem:
-                            self.docText[self.VAL_TEXT].append(xPar.text)
+                            docText[self.VAL_TEXT].append(xPar.text)
                     elif xItem.tag == self.VAL_NOTE:
                         for xPar in xItem:
-                            self.docText[self.VAL_NOTE].append(xPar.text)
+                            docText[self.VAL_NOTE].append(xPar.text)
                     else:
                         logger.error("DocOpen: Unknown tag '%s' in XML" % xItem.tag)
                 logger.debug("DocOpen: Opened document %s last saved on %s" % (
-                    self.itemHandle, self.docText[self.VAL_TIME]
+                    self.itemHandle, docText[self.VAL_TIME]
                 ))
         
-        return
+        return True
     
     def saveFile(self):
+        """Writes the whole document to its file, which replaces the previous file only when it
+        has been written in full. Any journal is then part of the file, and is removed. If the
+        text, notes and counts are the same as in the file, nothing is written, so the file
+        keeps its modification time, unless it is to be written with another compression.
+        Returns the number of bytes written."""
+        
+        if self.docPack is not None:
+            logger.error("DocSave: Document %s is in a packed project, which is read only" % self.itemHandle)
+            return 0
+        
+        docText  = self.docText
+        textHash = self.hashText(docText)
+        if textHash == self.diskHash and self.diskCompress == self.docCompress and path.isfile(self.fullPath):
+            logger.debug("DocSave: Document %s is unchanged, not saving it" % self.itemHandle)
+            self.removeJournal()
+            self.textChanged = False
+            self.jrnlBase    = self.copyText(docText)
+            return 0
         
         nwXML = ET.Element("novelWriterXML",attrib={
             "fileVersion" : "1.0",
@@ -121,48 +230,258 @@ class DocFile():
         
         xDoc = ET.SubElement(nwXML,"document",attrib={})
         countVals = {}
-        for countType in self.docText[self.VAL_COUNT].keys():
-            countVal = self.docText[self.VAL_COUNT][countType]
+        for countType in docText[self.VAL_COUNT].keys():
+            countVal = docText[self.VAL_COUNT][countType]
             if countVal is not None:
                 countVals[countType] = str(countVal)
         xCounts = ET.SubElement(xDoc,self.VAL_COUNT,attrib=countVals)
         
         parIdx = 0
         xText  = ET.SubElement(xDoc,self.VAL_TEXT)
-        for parItem in self.docText[self.VAL_TEXT]:
+        for parItem in docText[self.VAL_TEXT]:
             xPar = ET.SubElement(xText,"paragraph",attrib={"idx":str(parIdx)})
             xPar.text = ET.CDATA(parItem)
             parIdx += 1
         
         parIdx = 0
-        if len(self.docText[self.VAL_NOTE]) > 0:
+        if len(docText[self.VAL_NOTE]) > 0:
             xNote = ET.SubElement(xDoc,self.VAL_NOTE)
-            for parItem in self.docText[self.VAL_NOTE]:
+            for parItem in docText[self.VAL_NOTE]:
                 xPar = ET.SubElement(xNote,"paragraph",attrib={"idx":str(parIdx)})
                 xPar.text = ET.CDATA(parItem)
                 parIdx += 1
         
         logger.vverbose("Document file path is %s" % self.fullPath)
         
-        with open(self.fullPath,"wb") as outFile:
-            outFile.write(ET.tostring(
-                nwXML,
-                pretty_print    = True,
-                encoding        = "utf-8",
-                xml_declaration = True
-            ))
+        # Compressed files are written through the compressor as the XML is serialised
+        tempPath = self.fullPath+"~"
+        with open(tempPath,"wb") as outFile:
+            if self.docCompress == self.CMP_GZIP:
+                with gzip.GzipFile(filename="",fileobj=outFile,mode="wb",mtime=0) as cmpFile:
+                    ET.ElementTree(nwXML).write(
+                        cmpFile,
+                        pretty_print    = True,
+                        encoding        = "utf-8",
+                        xml_declaration = True
+                    )
+            elif self.docCompress == self.CMP_LZMA:
+                with lzma.LZMAFile(outFile,mode="wb") as cmpFile:
+                    ET.ElementTree(nwXML).write(
+                        cmpFile,
+                        pretty_print    = True,
+                        encoding        = "utf-8",
+                        xml_declaration = True
+                    )
+            else:
+                outFile.write(ET.tostring(
+                    nwXML,
+                    pretty_print    = True,
+                    encoding        = "utf-8",
+                    xml_declaration = True
+                ))
+            byteCount = outFile.tell()
+            outFile.flush()
+            fsync(outFile.fileno())
+        replace(tempPath,self.fullPath)
+        logger.debug("DocSave: Wrote %d bytes to %s" % (byteCount,self.docFile))
         
-        return
+        self.removeJournal()
+        self.textChanged  = False
+        self.jrnlBase     = self.copyText(docText)
+        self.diskHash     = textHash
+        self.diskCompress = self.docCompress
+        
+        return byteCount
     
     def setText(self, newText, newCount, newNote=[]):
         
+        docText = self.docText
         for n in range(4):
             if len(newCount) > n:
-                self.docText[self.VAL_COUNT][self.validCount[n]] = newCount[n]
+                docText[self.VAL_COUNT][self.validCount[n]] = newCount[n]
+        
+        docText[self.VAL_TEXT] = newText
+        docText[self.VAL_NOTE] = newNote
+        
+        # The text can't be dropped from memory until it has been saved
+        self.textChanged = True
+        if self.docCache is not None:
+            self.docCache.updateDoc(self)
+        
+        return
+    
+    def unloadFile(self):
+        """Drops the text from memory. It is read again from disk the next time it is used."""
+        self.textData   = self.emptyText()
+        self.textLoaded = False
+        self.jrnlBase   = None
+        return
+    
+    #
+    # Journal
+    #
+    
+    def saveJournal(self):
+        """Appends the changes made to the text since the document, or the journal, was last
+        written to the journal file next to the document, instead of writing the whole document.
+        Each call adds one line holding the paragraphs that were replaced, inserted or removed,
+        so a crash can at most cut the last entry short. Returns the number of bytes written."""
+        
+        if not self.textLoaded: return 0
+        if self.docPack is not None:
+            logger.error("DocSave: Document %s is in a packed project, which is read only" % self.itemHandle)
+            return 0
+        
+        docText   = self.textData
+        jrnlEntry = {}
+        for valKey, baseList in ((self.VAL_TEXT,self.jrnlBase[0]),(self.VAL_NOTE,self.jrnlBase[1])):
+            parOps = self.diffPars(baseList,docText[valKey])
+            if len(parOps) > 0:
+                jrnlEntry[valKey] = parOps
+        if docText[self.VAL_COUNT] != self.jrnlBase[2]:
+            jrnlEntry[self.VAL_COUNT] = docText[self.VAL_COUNT]
+        
+        if len(jrnlEntry) == 0:
+            return 0
+        
+        # A new journal starts with the hash of the document file it applies to
+        jrnlData = ""
+        if not path.isfile(self.jrnlPath):
+            jrnlData += json.dumps({"base" : self.fileHash()})+"\n"
+        jrnlData += json.dumps(jrnlEntry)+"\n"
+        
+        with open(self.jrnlPath,"a",encoding="utf-8") as outFile:
+            byteCount = outFile.write(jrnlData)
+            outFile.flush()
+            fsync(outFile.fileno())
+        logger.debug("DocSave: Wrote %d bytes to journal %s" % (byteCount,self.jrnlFile))
+        
+        self.jrnlBase = self.copyText(docText)
+        
+        return byteCount
+    
+    def readJournal(self, docText):
+        """Applies the entries in the journal to the text read from the document file, and
+        returns how many there were. A journal written for another version of the document file
+        is already part of that file, as the program stopped after saving the file but before the
+        journal was removed, so it is removed now. An entry cut short by a crash is dropped.
+        A journal in a pack is applied in the same way, but the pack itself is never changed."""
+        
+        if self.docPack is not None:
+            jrnlData = self.docPack.readFile(self.jrnlFile)
+            if jrnlData is None: return 0
+            jrnlLines = jrnlData.decode("utf-8").splitlines(keepends=True)
+        elif not path.isfile(self.jrnlPath):
+            return 0
+        else:
+            with open(self.jrnlPath,"r",encoding="utf-8") as inFile:
+                jrnlLines = inFile.readlines()
+        
+        try:
+            jrnlHead = json.loads(jrnlLines[0])
+        except (ValueError,IndexError):
+            jrnlHead = {}
+        if not jrnlHead.get("base") == self.fileHash():
+            logger.info("DocOpen: Journal %s doesn't match the document file, removing it" % self.jrnlFile)
+            if self.docPack is None:
+                remove(self.jrnlPath)
+            return 0
+        
+        jrnlCount = 0
+        for jrnlLine in jrnlLines[1:]:
+            try:
+                if not jrnlLine.endswith("\n"):
+                    raise ValueError("Entry is incomplete")
+                jrnlEntry = json.loads(jrnlLine)
+            except ValueError:
+                # Later entries would be appended after the broken one, so it is cut off
+                logger.warning("DocOpen: Journal %s ends with an incomplete entry, dropping it" % self.jrnlFile)
+                if self.docPack is None:
+                    with open(self.jrnlPath,"w",encoding="utf-8") as outFile:
+                        outFile.write("".join(jrnlLines[:jrnlCount+1]))
+                break
+            for valKey in (self.VAL_TEXT,self.VAL_NOTE):
+                if valKey in jrnlEntry:
+                    self.patchPars(docText[valKey],jrnlEntry[valKey])
+            if self.VAL_COUNT in jrnlEntry:
+                for countType in self.validCount:
+                    if countType in jrnlEntry[self.VAL_COUNT]:
+                        docText[self.VAL_COUNT][countType] = jrnlEntry[self.VAL_COUNT][countType]
+            jrnlCount += 1
         
-        self.docText[self.VAL_TEXT] = newText
-        self.docText[self.VAL_NOTE] = newNote
+        logger.debug("DocOpen: Applied %d journal entries to document %s" % (jrnlCount,self.itemHandle))
         
+        return jrnlCount
+    
+    def hasJournal(self):
+        if self.docPack is not None:
+            return False
+        return path.isfile(self.jrnlPath)
+    
+    def removeJournal(self):
+        if self.docPack is None and path.isfile(self.jrnlPath):
+            remove(self.jrnlPath)
+            logger.debug("DocSave: Removed journal %s" % self.jrnlFile)
+        return
+    
+    #
+    # Internal Functions
+    #
+    
+    def setLoaded(self, docText):
+        self.textData    = docText
+        self.textLoaded  = True
+        self.textChanged = False
+        self.jrnlBase    = self.copyText(docText)
+        if self.docCache is not None:
+            self.docCache.updateDoc(self)
+        return
+    
+    def copyText(self, docText):
+        """Copies the lists of the text as it is on disk, which the journal is compared to. The
+        paragraphs themselves are not copied."""
+        return (
+            list(docText[self.VAL_TEXT]),
+            list(docText[self.VAL_NOTE]),
+            dict(docText[self.VAL_COUNT]),
+        )
+    
+    def hashText(self, docText):
+        """Returns a hash of the paragraphs, notes and counts, which is what is saved."""
+        return sha256(json.dumps([
+            docText[self.VAL_TEXT],
+            docText[self.VAL_NOTE],
+            docText[self.VAL_COUNT],
+        ],sort_keys=True).encode("utf-8")).digest()
+    
+    def fileHash(self):
+        if self.docPack is not None:
+            fileData = self.docPack.readFile(self.docFile)
+            if fileData is None:
+                return ""
+            return sha256(fileData).hexdigest()
+        if not path.isfile(self.fullPath):
+            return ""
+        with open(self.fullPath,"rb") as inFile:
+            return sha256(inFile.read()).hexdigest()
+    
+    def diffPars(self, oldPars, newPars):
+        """Returns the changes from one list of paragraphs to another, as a list of the ranges
+        of oldPars to replace and the paragraphs to replace them with."""
+        if oldPars == newPars:
+            return []
+        parOps = []
+        parDiff = SequenceMatcher(None,oldPars,newPars,autojunk=False)
+        for opTag, i1, i2, j1, j2 in parDiff.get_opcodes():
+            if opTag != "equal":
+                parOps.append([i1,i2,newPars[j1:j2]])
+        return parOps
+    
+    def patchPars(self, parList, parOps):
+        """Applies the changes from diffPars. The last range goes first, so the positions of
+        the ones before it still hold."""
+        for i1, i2, newPars in reversed(parOps):
+            parList[i1:i2] = newPars
         return
     
 # End Class DocFile
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*
+"""novelWriter Document Cache Class
+
+ novelWriter – Document Cache Class
+====================================
+ Limits the memory used by the text of the documents in a project
+
+ File History:
+ Created: 2017-11-08 [0.4.0]
+
+"""
+
+import logging
+import nw
+
+from collections import OrderedDict
+from threading   import RLock
+
+logger = logging.getLogger(__name__)
+
+class DocCache():
+    
+    DEFAULT_BYTES = 64*1024*1024
+    
+    def __init__(self, maxBytes=DEFAULT_BYTES):
+        """Keeps track of the documents that have their text in memory, in the order they were
+        last used. When the text of all of them adds up to more than maxBytes, the text of the
+        least recently used documents is dropped, and the documents read it from disk again the
+        next time it is needed. Pinned documents, like those open in the editor, and documents
+        with changes that haven't been saved, are never dropped. Documents can be read from
+        several threads at once, see Book.openDocs, so all changes are made under a lock."""
+        
+        self.maxBytes  = maxBytes
+        self.curBytes  = 0
+        self.docItems  = OrderedDict()
+        self.docSizes  = {}
+        self.docPins   = {}
+        self.cacheLock = RLock()
+        
+        return
+    
+    def setLimit(self, maxBytes):
+        with self.cacheLock:
+            self.maxBytes = maxBytes
+            self.evictDocs()
+        return
+    
+    def clearCache(self):
+        """Forgets all documents and pins, without unloading anything. Used when the tree is
+        cleared, and the documents go away with it."""
+        with self.cacheLock:
+            self.curBytes = 0
+            self.docItems = OrderedDict()
+            self.docSizes = {}
+            self.docPins  = {}
+        return
+    
+    #
+    # Track Documents
+    #
+    
+    def touchDoc(self, docItem):
+        """Moves a document to the most recently used end of the cache."""
+        with self.cacheLock:
+            if docItem.itemHandle in self.docItems:
+                self.docItems.move_to_end(docItem.itemHandle)
+        return
+    
+    def updateDoc(self, docItem):
+        """Records the size of a document's text after it has been read or changed, and drops
+        the text of other documents if the cache has gone over its limit."""
+        
+        theHandle = docItem.itemHandle
+        docSize   = docItem.textSize()
+        with self.cacheLock:
+            if theHandle in self.docSizes:
+                self.curBytes -= self.docSizes[theHandle]
+            self.curBytes += docSize
+            self.docSizes[theHandle] = docSize
+            self.docItems[theHandle] = docItem
+            self.docItems.move_to_end(theHandle)
+            self.evictDocs(theHandle)
+        
+        return
+    
+    def dropDoc(self, docItem):
+        """Stops tracking a document, for instance because it has been deleted."""
+        
+        theHandle = docItem.itemHandle
+        with self.cacheLock:
+            if theHandle in self.docItems:
+                self.curBytes -= self.docSizes.pop(theHandle)
+                del self.docItems[theHandle]
+            self.docPins.pop(theHandle,None)
+        
+        return
+    
+    def pinDoc(self, itemHandle):
+        """Keeps the text of a document in memory until it is unpinned. Pins are counted, so
+        each call must be matched by a call to unpinDoc."""
+        with self.cacheLock:
+            self.docPins[itemHandle] = self.docPins.get(itemHandle,0) + 1
+        return
+    
+    def unpinDoc(self, itemHandle):
+        with self.cacheLock:
+            if itemHandle not in self.docPins:
+                logger.debug("DocCache: Document %s is not pinned" % itemHandle)
+                return
+            self.docPins[itemHandle] -= 1
+            if self.docPins[itemHandle] <= 0:
+                del self.docPins[itemHandle]
+                self.evictDocs()
+        return
+    
+    #
+    # Internal Functions
+    #
+    
+    def evictDocs(self, keepHandle=None):
+        """Drops the text of the least recently used documents until the cache is within its
+        limit, skipping pinned and changed documents, and the document keepHandle, which is in
+        use. Must be called with the lock held."""
+        
+        overBytes = self.curBytes - self.maxBytes
+        if overBytes <= 0: return
+        
+        dropList = []
+        for theHandle in self.docItems.keys():
+            if overBytes <= 0: break
+            if theHandle in self.docPins or theHandle == keepHandle: continue
+            if self.docItems[theHandle].textChanged: continue
+            dropList.append(theHandle)
+            overBytes -= self.docSizes[theHandle]
+        
+        for theHandle in dropList:
+            self.docItems.pop(theHandle).unloadFile()
+            self.curBytes -= self.docSizes.pop(theHandle)
+        
+        if len(dropList) > 0:
+            logger.debug("DocCache: Dropped the text of %d document(s), now holding %d bytes" % (
+                len(dropList),self.curBytes
+            ))
+        
+        return
+    
+# End Class DocCache
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*
+"""novelWriter Handle Allocator Class
+
+ novelWriter – Handle Allocator Class
+======================================
+ Hands out unique item handles for the book tree
+
+ File History:
+ Created: 2017-11-06 [0.4.0]
+
+"""
+
+import logging
+import nw
+
+from random import SystemRandom
+
+logger = logging.getLogger(__name__)
+
+class HandleAllocator():
+    
+    HANDLE_BITS = 52
+    HANDLE_MASK = (1 << HANDLE_BITS) - 1
+    
+    def __init__(self, isTaken=None):
+        """Handles are 13 character hex strings, the same format as the previous time based
+        hashes, so existing document file names stay valid. A random 52 bit starting point is
+        picked once, and handles are then counted up from there. A sequence can't repeat itself
+        before it wraps around, so the only check needed is the optional isTaken function,
+        which should return True for handles already in use in the project."""
+        
+        self.isTaken   = isTaken
+        self.nextValue = SystemRandom().getrandbits(self.HANDLE_BITS)
+        
+        return
+    
+    def newHandle(self):
+        return self.newHandles(1)[0]
+    
+    def newHandles(self, newCount):
+        """Returns a list of newCount unique handles."""
+        
+        newList = []
+        while len(newList) < newCount:
+            newHandle = "%013x" % self.nextValue
+            self.nextValue = (self.nextValue + 1) & self.HANDLE_MASK
+            if self.isTaken is not None and self.isTaken(newHandle):
+                logger.debug("HandleAllocator: Handle %s is taken, skipping it" % newHandle)
+                continue
+            newList.append(newHandle)
+        
+        return newList
+    
+# End Class HandleAllocator
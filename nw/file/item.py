@@ -68,6 +68,28 @@ class BookItem():
     validTypes     = [TYP_BOOK,TYP_CHAR,TYP_PLOT,TYP_NOTE]
     validSubTypes  = [SUB_PRO,SUB_CHAP,SUB_EPI,SUB_APPEND,SUB_ARCH]
         
+    # Attribute holding the value of each tag, shared by all items
+    tagAttr = {
+        TAG_CLASS   : "itemClass",
+        TAG_LEVEL   : "itemLevel",
+        TAG_TYPE    : "itemType",
+        TAG_SUBTYPE : "itemSubType",
+        TAG_TITLE   : "itemTitle",
+        TAG_NAME    : "itemName",
+        TAG_COMMENT : "itemComment",
+        TAG_ROLE    : "itemRole",
+        TAG_NUMBER  : "itemNumber",
+        TAG_COMPILE : "itemCompile",
+        TAG_IMPORT  : "itemImportance",
+        TAG_POV     : "itemPOV",
+        META_PARS   : "metaParCount",
+        META_SENTS  : "metaSentCount",
+        META_WORDS  : "metaWordCount",
+        META_CHARS  : "metaCharCount",
+    }
+    
+    __slots__ = tuple(tagAttr.values()) + ("sceneChars","scenePlots")
+    
     def __init__(self):
         
         self.itemClass      = None
@@ -91,55 +113,17 @@ class BookItem():
         self.sceneChars     = []
         self.scenePlots     = []
         
-        self.tagMap = {
-            self.TAG_CLASS   : self.setClass,
-            self.TAG_LEVEL   : self.setLevel,
-            self.TAG_TYPE    : self.setType,
-            self.TAG_SUBTYPE : self.setSubType,
-            self.TAG_TITLE   : self.setTitle,
-            self.TAG_NAME    : self.setName,
-            self.TAG_COMMENT : self.setComment,
-            self.TAG_ROLE    : self.setRole,
-            self.TAG_NUMBER  : self.setNumber,
-            self.TAG_COMPILE : self.setCompile,
-            self.TAG_IMPORT  : self.setImportance,
-            self.TAG_POV     : self.setPOV,
-            self.META_PARS   : self.setParCount,
-            self.META_SENTS  : self.setSentCount,
-            self.META_WORDS  : self.setWordCount,
-            self.META_CHARS  : self.setCharCount,
-        }
-        
         return
     
     def getFromTag(self,getTag):
-        if getTag in self.validTags:
-            if getTag == self.TAG_CLASS:   return self.itemClass
-            if getTag == self.TAG_LEVEL:   return self.itemLevel
-            if getTag == self.TAG_TYPE:    return self.itemType
-            if getTag == self.TAG_SUBTYPE: return self.itemSubType
-            if getTag == self.TAG_TITLE:   return self.itemTitle
-            if getTag == self.TAG_NAME:    return self.itemName
-            if getTag == self.TAG_COMMENT: return self.itemComment
-            if getTag == self.TAG_ROLE:    return self.itemRole
-            if getTag == self.TAG_NUMBER:  return self.itemNumber
-            if getTag == self.TAG_COMPILE: return self.itemCompile
-            if getTag == self.TAG_IMPORT:  return self.itemImportance
-            if getTag == self.TAG_POV:     return self.itemPOV
-        elif getTag in self.validMeta:
-            if getTag == self.META_PARS:   return self.metaParCount
-            if getTag == self.META_SENTS:  return self.metaSentCount
-            if getTag == self.META_WORDS:  return self.metaWordCount
-            if getTag == self.META_CHARS:  return self.metaCharCount
-        else:
-            logger.error("Unknown tag '%s'" % setTag)
+        if getTag in self.tagAttr:
+            return getattr(self,self.tagAttr[getTag])
+        logger.error("Unknown tag '%s'" % getTag)
         return
     
     def setFromTag(self,setTag,newValue):
-        if setTag in self.validTags:
-            self.tagMap[setTag](newValue)
-        elif setTag in self.validMeta:
-            self.tagMap[setTag](newValue)
+        if setTag in self.tagSetter:
+            self.tagSetter[setTag](self,newValue)
         else:
             logger.error("Unknown tag '%s'" % setTag)
         return
@@ -346,4 +330,25 @@ class BookItem():
             self.scenePlots.remove(rmPlot)
         return
     
+    # Setter for each tag, shared by all items. The setters are plain functions here, so they
+    # are called with the item as the first argument.
+    tagSetter = {
+        TAG_CLASS   : setClass,
+        TAG_LEVEL   : setLevel,
+        TAG_TYPE    : setType,
+        TAG_SUBTYPE : setSubType,
+        TAG_TITLE   : setTitle,
+        TAG_NAME    : setName,
+        TAG_COMMENT : setComment,
+        TAG_ROLE    : setRole,
+        TAG_NUMBER  : setNumber,
+        TAG_COMPILE : setCompile,
+        TAG_IMPORT  : setImportance,
+        TAG_POV     : setPOV,
+        META_PARS   : setParCount,
+        META_SENTS  : setSentCount,
+        META_WORDS  : setWordCount,
+        META_CHARS  : setCharCount,
+    }
+    
 # End Class BookItem
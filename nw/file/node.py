@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*
+"""novelWriter Tree Node Class
+
+ novelWriter – Tree Node Class
+===============================
+ A single record in the book tree, linking a handle to its item and document
+
+ File History:
+ Created: 2017-11-05 [0.4.0]
+
+"""
+
+import logging
+import nw
+
+logger = logging.getLogger(__name__)
+
+class TreeNode():
+    
+    __slots__ = ("handle","parent","order","entry","doc")
+    
+    validKeys = frozenset(__slots__)
+    
+    def __init__(self, tHandle, pHandle, tOrder, bookItem, docItem):
+        """Holds one entry of BookTree.theTree. The fields are slots, which keeps the record
+        much smaller than a dictionary, but they can still be read and written with the keys
+        "handle", "parent", "order", "entry" and "doc" like the dictionaries used previously."""
+        
+        self.handle = tHandle
+        self.parent = pHandle
+        self.order  = tOrder
+        self.entry  = bookItem
+        self.doc    = docItem
+        
+        return
+    
+    def __getitem__(self, theKey):
+        if theKey in self.validKeys:
+            return getattr(self,theKey)
+        raise KeyError(theKey)
+    
+    def __setitem__(self, theKey, theValue):
+        if theKey in self.validKeys:
+            setattr(self,theKey,theValue)
+            return
+        raise KeyError(theKey)
+    
+    def __contains__(self, theKey):
+        return theKey in self.validKeys
+    
+    def __repr__(self):
+        return "TreeNode(%s, parent=%s, order=%s)" % (self.handle,self.parent,self.order)
+    
+    def keys(self):
+        return self.__slots__
+    
+    def get(self, theKey, defaultValue=None):
+        if theKey in self.validKeys:
+            return getattr(self,theKey)
+        return defaultValue
+    
+# End Class TreeNode
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*
+"""novelWriter Book Pack Class
+
+ novelWriter – Book Pack Class
+===============================
+ Single file container for a project file and its documents
+
+ File History:
+ Created: 2017-11-09 [0.4.0]
+
+"""
+
+import logging
+import json
+import mmap
+import struct
+import nw
+
+from os import path, listdir, mkdir, replace, fsync
+
+logger = logging.getLogger(__name__)
+
+class BookPack():
+    
+    PACK_MAGIC   = b"NWPACK\x00\x00"
+    PACK_VERSION = 1
+    PACK_HEAD    = struct.Struct("<8sIIQQ")
+    
+    def __init__(self, packPath):
+        """A pack holds a project file and all the files in its document folder in one file.
+        The files are stored one after the other, byte for byte, and are followed by an index
+        with the offset and length of each of them. The header at the start of the file points
+        to the index. A document is read by looking it up in the index and slicing it out of
+        a memory map of the pack, so nothing is unpacked."""
+        
+        self.packPath  = packPath
+        self.bookFile  = None
+        self.packIndex = {}
+        self.packFile  = None
+        self.packMap   = None
+        
+        return
+    
+    #
+    # Read a Pack
+    #
+    
+    def openPack(self):
+        """Maps the pack into memory and reads its index. Returns False if the file is not a
+        valid pack."""
+        
+        self.closePack()
+        
+        try:
+            self.packFile = open(self.packPath,"rb")
+            packHead = self.packFile.read(self.PACK_HEAD.size)
+            if len(packHead) < self.PACK_HEAD.size:
+                raise ValueError("File is too short")
+            packMagic, packVersion, _, indexOffset, indexLength = self.PACK_HEAD.unpack(packHead)
+            if packMagic != self.PACK_MAGIC:
+                raise ValueError("Not a novelWriter pack")
+            if packVersion != self.PACK_VERSION:
+                raise ValueError("Unknown pack version %d" % packVersion)
+            self.packMap = mmap.mmap(self.packFile.fileno(),0,access=mmap.ACCESS_READ)
+            packIndex = json.loads(self.packMap[indexOffset:indexOffset+indexLength].decode("utf-8"))
+            self.bookFile  = packIndex["book"]
+            self.packIndex = packIndex["files"]
+        except Exception as e:
+            logger.error("BookPack: Failed to open pack %s" % self.packPath)
+            logger.error(str(e))
+            self.closePack()
+            return False
+        
+        logger.debug("BookPack: Opened pack with %d files" % len(self.packIndex))
+        
+        return True
+    
+    def closePack(self):
+        if self.packMap is not None:
+            self.packMap.close()
+            self.packMap = None
+        if self.packFile is not None:
+            self.packFile.close()
+            self.packFile = None
+        return
+    
+    def hasFile(self, fileName):
+        return fileName in self.packIndex
+    
+    def readFile(self, fileName):
+        """Returns the content of a file in the pack, or None if it isn't there."""
+        if fileName not in self.packIndex:
+            return None
+        fileOffset, fileLength = self.packIndex[fileName]
+        return self.packMap[fileOffset:fileOffset+fileLength]
+    
+    def readBook(self):
+        return self.readFile(self.bookFile)
+    
+    #
+    # Pack and Unpack
+    #
+    
+    def packBook(self, bookPath):
+        """Writes the project file bookPath, and every file in its document folder, to the
+        pack. The pack is written to a temporary file first, which then replaces any existing
+        pack. Returns the number of files packed."""
+        
+        bookFile = path.basename(bookPath)
+        docPath  = bookPath[:-4]+".nwd"
+        
+        packFiles = [(bookFile,bookPath)]
+        if path.isdir(docPath):
+            for docFile in sorted(listdir(docPath)):
+                if docFile.endswith("~"): continue
+                filePath = path.join(docPath,docFile)
+                if path.isfile(filePath):
+                    packFiles.append((docFile,filePath))
+        
+        packIndex = {}
+        tempPath  = self.packPath+"~"
+        with open(tempPath,"wb") as outFile:
+            outFile.write(self.PACK_HEAD.pack(self.PACK_MAGIC,self.PACK_VERSION,0,0,0))
+            for fileName, filePath in packFiles:
+                with open(filePath,"rb") as inFile:
+                    fileData = inFile.read()
+                packIndex[fileName] = [outFile.tell(),len(fileData)]
+                outFile.write(fileData)
+            
+            indexOffset = outFile.tell()
+            indexData   = json.dumps({"book" : bookFile, "files" : packIndex}).encode("utf-8")
+            outFile.write(indexData)
+            outFile.seek(0)
+            outFile.write(self.PACK_HEAD.pack(
+                self.PACK_MAGIC,self.PACK_VERSION,0,indexOffset,len(indexData)
+            ))
+            outFile.flush()
+            fsync(outFile.fileno())
+        replace(tempPath,self.packPath)
+        
+        logger.info("BookPack: Packed %d files into %s" % (len(packFiles),self.packPath))
+        
+        return len(packFiles)
+    
+    def unpackBook(self, bookPath):
+        """Writes the files in the pack back out as the project file bookPath and its document
+        folder, byte for byte. Returns the number of files unpacked, or -1 on failure."""
+        
+        if self.packMap is None and not self.openPack():
+            return -1
+        
+        docPath = bookPath[:-4]+".nwd"
+        if not path.isdir(docPath):
+            mkdir(docPath)
+        
+        for fileName in self.packIndex.keys():
+            if fileName != path.basename(fileName):
+                logger.error("BookPack: Skipping file %s outside the document folder" % fileName)
+                continue
+            if fileName == self.bookFile:
+                filePath = bookPath
+            else:
+                filePath = path.join(docPath,fileName)
+            with open(filePath,"wb") as outFile:
+                outFile.write(self.readFile(fileName))
+        
+        logger.info("BookPack: Unpacked %d files to %s" % (len(self.packIndex),bookPath))
+        
+        return len(self.packIndex)
+    
+# End Class BookPack
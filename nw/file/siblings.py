@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*
+"""novelWriter Sibling List Class
+
+ novelWriter – Sibling List Class
+==================================
+ Ordered list of the children of a single entry in the book tree
+
+ File History:
+ Created: 2017-11-04 [0.4.0]
+
+"""
+
+import logging
+import nw
+
+logger = logging.getLogger(__name__)
+
+class SiblingList():
+    
+    def __init__(self, theHandles=[]):
+        """Holds the handles of the children of one tree entry as a doubly linked list, so that
+        appending, removing, and moving an entry up or down are all constant time operations.
+        Iterating through the list returns the handles in order."""
+        
+        self.firstHandle = None
+        self.lastHandle  = None
+        self.prevHandle  = {}
+        self.nextHandle  = {}
+        
+        for theHandle in theHandles:
+            self.append(theHandle)
+        
+        return
+    
+    def __len__(self):
+        return len(self.nextHandle)
+    
+    def __contains__(self, theHandle):
+        return theHandle in self.nextHandle
+    
+    def __iter__(self):
+        theHandle = self.firstHandle
+        while theHandle is not None:
+            yield theHandle
+            theHandle = self.nextHandle[theHandle]
+    
+    def __repr__(self):
+        return "SiblingList(%s)" % str(list(self))
+    
+    #
+    # Add and Remove Entries
+    #
+    
+    def append(self, newHandle):
+        
+        if newHandle in self.nextHandle:
+            logger.warning("SiblingList: Handle %s is already in the list" % newHandle)
+            return
+        
+        self.prevHandle[newHandle] = self.lastHandle
+        self.nextHandle[newHandle] = None
+        if self.lastHandle is None:
+            self.firstHandle = newHandle
+        else:
+            self.nextHandle[self.lastHandle] = newHandle
+        self.lastHandle = newHandle
+        
+        return
+    
+    def prepend(self, newHandle):
+        
+        if newHandle in self.nextHandle:
+            logger.warning("SiblingList: Handle %s is already in the list" % newHandle)
+            return
+        
+        self.prevHandle[newHandle] = None
+        self.nextHandle[newHandle] = self.firstHandle
+        if self.firstHandle is None:
+            self.lastHandle = newHandle
+        else:
+            self.prevHandle[self.firstHandle] = newHandle
+        self.firstHandle = newHandle
+        
+        return
+    
+    def remove(self, rmHandle):
+        
+        if rmHandle not in self.nextHandle:
+            logger.warning("SiblingList: Handle %s is not in the list" % rmHandle)
+            return
+        
+        prevHandle = self.prevHandle.pop(rmHandle)
+        nextHandle = self.nextHandle.pop(rmHandle)
+        if prevHandle is None:
+            self.firstHandle = nextHandle
+        else:
+            self.nextHandle[prevHandle] = nextHandle
+        if nextHandle is None:
+            self.lastHandle = prevHandle
+        else:
+            self.prevHandle[nextHandle] = prevHandle
+        
+        return
+    
+    #
+    # Reorder Entries
+    #
+    
+    def moveUp(self, theHandle):
+        """Swaps an entry with the one before it. Returns False if it is already first."""
+        prevHandle = self.getPrev(theHandle)
+        if prevHandle is None: return False
+        self.swapNext(prevHandle)
+        return True
+    
+    def moveDown(self, theHandle):
+        """Swaps an entry with the one after it. Returns False if it is already last."""
+        if self.getNext(theHandle) is None: return False
+        self.swapNext(theHandle)
+        return True
+    
+    def swapNext(self, theHandle):
+        """Swaps an entry with the one after it by relinking the four entries involved."""
+        
+        aHandle = theHandle
+        bHandle = self.nextHandle[aHandle]
+        pHandle = self.prevHandle[aHandle]
+        nHandle = self.nextHandle[bHandle]
+        
+        self.prevHandle[bHandle] = pHandle
+        self.nextHandle[bHandle] = aHandle
+        self.prevHandle[aHandle] = bHandle
+        self.nextHandle[aHandle] = nHandle
+        
+        if pHandle is None:
+            self.firstHandle = bHandle
+        else:
+            self.nextHandle[pHandle] = bHandle
+        if nHandle is None:
+            self.lastHandle = aHandle
+        else:
+            self.prevHandle[nHandle] = aHandle
+        
+        return
+    
+    #
+    # Getters
+    #
+    
+    def getFirst(self):
+        return self.firstHandle
+    
+    def getLast(self):
+        return self.lastHandle
+    
+    def getPrev(self, theHandle):
+        if theHandle in self.prevHandle:
+            return self.prevHandle[theHandle]
+        return None
+    
+    def getNext(self, theHandle):
+        if theHandle in self.nextHandle:
+            return self.nextHandle[theHandle]
+        return None
+    
+# End Class SiblingList
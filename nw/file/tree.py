@@ -13,12 +13,15 @@
 import logging
 import nw
 
-from os           import path
-from time         import time
-from hashlib      import sha256
-from itertools    import chain
-from nw.file.item import BookItem
-from nw.file.doc  import DocFile
+from os               import path, remove
+from itertools        import chain
+from contextlib       import contextmanager
+from nw.file.item     import BookItem
+from nw.file.doc      import DocFile
+from nw.file.doccache import DocCache
+from nw.file.node     import TreeNode
+from nw.file.siblings import SiblingList
+from nw.file.handles  import HandleAllocator
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +34,10 @@ class BookTree():
     
     validOrder = [ORD_UP,ORD_DOWN,ORD_NUP,ORD_NDOWN]
     
+    # Deleted entries are compacted out of theTree once there are this many of them, and they
+    # make up at least a quarter of the tree
+    COMPACT_MIN = 64
+    
     def __init__(self):
         
         self.docPath    = None
@@ -38,7 +45,25 @@ class BookTree():
         self.treeLookup = {}
         self.parOfItems = {}
         self.parOfFiles = {}
-        self.treeOrder  = []
+        self.typeIndex  = {}
+        self.theOrder   = []
+        self.orderIndex = {}
+        self.orderValid = True
+        self.deadCount  = 0
+        self.purgeFiles = []
+        self.handleGen  = HandleAllocator(self.hasHandle)
+        self.docCache   = DocCache()
+        
+        # Compression used when writing document files, and the pack documents are read from
+        self.docCompress = DocFile.CMP_NONE
+        self.docPack     = None
+        
+        # Batched changes, and functions to call when the tree has changed
+        self.batchDepth = 0
+        self.batchAdded = {}
+        self.batchDirty = {}
+        self.sortQueued = False
+        self.treeWatch  = []
         
         self.fixedOrder = [
             BookItem.TYP_BOOK,
@@ -62,7 +87,18 @@ class BookTree():
         self.treeLookup = {}
         self.parOfItems = {}
         self.parOfFiles = {}
-        self.treeOrder  = []
+        self.typeIndex  = {}
+        self.theOrder   = []
+        self.orderIndex = {}
+        self.orderValid = True
+        self.deadCount  = 0
+        self.purgeFiles = []
+        self.batchAdded = {}
+        self.batchDirty = {}
+        self.sortQueued = False
+        self.docCache.clearCache()
+        self.docCompress = DocFile.CMP_NONE
+        self.docPack     = None
         
         self.fixedOrder = [
             BookItem.TYP_BOOK,
@@ -85,16 +121,16 @@ class BookTree():
     
     def addFile(self, pHandle):
         
-        parEntry = self.getItem(pHandle)["entry"]
+        parEntry = self.getItem(pHandle).entry
         parClass = parEntry.itemClass
         parType  = parEntry.itemType
         
         if not parClass == BookItem.CLS_CONT:
             logger.debug("BookTree: Entry is not a container, getting its parent")
-            parParent = self.getItem(pHandle)["parent"]
+            parParent = self.getItem(pHandle).parent
             if not parParent is None:
                 pHandle  = parParent
-                parEntry = self.getItem(pHandle)["entry"]
+                parEntry = self.getItem(pHandle).entry
                 parClass = parEntry.itemClass
                 parType  = parEntry.itemType
             else:
@@ -116,8 +152,8 @@ class BookTree():
         newItem.setName(newName)
         newItem.setCompile(newCompile)
         
-        self.appendItem(None,pHandle,None,newItem)
-        self.sortTree()
+        tHandle = self.appendItem(None,pHandle,None,newItem)
+        self.indexItem(tHandle)
         
         return
     
@@ -131,8 +167,8 @@ class BookTree():
         newItem.setName("New Chapter")
         newItem.setCompile(True)
         
-        self.appendItem(None,self.fixedItems[BookItem.TYP_BOOK],None,newItem)
-        self.sortTree()
+        tHandle = self.appendItem(None,self.fixedItems[BookItem.TYP_BOOK],None,newItem)
+        self.indexItem(tHandle)
         
         return
     
@@ -144,8 +180,8 @@ class BookTree():
         newItem.setType(BookItem.TYP_CHAR)
         newItem.setName("New Character")
         
-        self.appendItem(None,self.fixedItems[BookItem.TYP_CHAR],None,newItem)
-        self.sortTree()
+        tHandle = self.appendItem(None,self.fixedItems[BookItem.TYP_CHAR],None,newItem)
+        self.indexItem(tHandle)
         
         return
     
@@ -157,27 +193,124 @@ class BookTree():
         newItem.setType(BookItem.TYP_PLOT)
         newItem.setName("New Plot")
         
-        self.appendItem(None,self.fixedItems[BookItem.TYP_PLOT],None,newItem)
-        self.sortTree()
+        tHandle = self.appendItem(None,self.fixedItems[BookItem.TYP_PLOT],None,newItem)
+        self.indexItem(tHandle)
         
         return
     
+    #
+    # Batched Changes
+    #
+    
+    @contextmanager
+    def batch(self):
+        """Groups many changes to the tree. Within a batch, entries that are appended but not
+        indexed, and calls to sortTree, are held back until the batch ends. The indices are then
+        rebuilt at most once, the tree order is refreshed, and the watch functions are called once
+        with all the changed handles. Batches can be nested, and only the outermost one counts."""
+        
+        self.batchDepth += 1
+        try:
+            yield self
+        finally:
+            self.batchDepth -= 1
+            if self.batchDepth == 0:
+                self.finishBatch()
+        
+        return
+    
+    def finishBatch(self):
+        
+        # Entries appended but not indexed go last among their siblings. ITEMs go first, so the
+        # FILEs below them have a parent to go to. If any of them can't be placed, the indices
+        # are rebuilt with sortTree instead.
+        for itemLevel in (BookItem.LEV_ITEM,BookItem.LEV_FILE):
+            if self.sortQueued: break
+            for tHandle in list(self.batchAdded.keys()):
+                if self.getItem(tHandle).entry.itemLevel != itemLevel: continue
+                if not self.placeItem(tHandle):
+                    self.sortQueued = True
+                    break
+        if len(self.batchAdded) > 0:
+            self.sortQueued = True
+        
+        if self.sortQueued:
+            logger.debug("BookTree: Rebuilding the index after %d batched change(s)" % len(self.batchDirty))
+            self.sortTree()
+        else:
+            self.refreshOrder()
+        
+        changedHandles  = list(self.batchDirty.keys())
+        self.batchAdded = {}
+        self.batchDirty = {}
+        self.sortQueued = False
+        
+        if len(changedHandles) > 0:
+            self.notifyWatch(changedHandles)
+        
+        return
+    
+    def markChanged(self, changedHandles):
+        """Records changed entries. Outside a batch, the watch functions are called right away."""
+        if self.batchDepth > 0:
+            for itemHandle in changedHandles:
+                self.batchDirty[itemHandle] = True
+        else:
+            self.notifyWatch(changedHandles)
+        return
+    
+    #
+    # Change Notification
+    #
+    
+    def addWatch(self, watchFunc):
+        """Adds a function to be called with a list of changed handles whenever the tree has
+        changed. Within a batch, it is called once when the batch ends."""
+        if watchFunc not in self.treeWatch:
+            self.treeWatch.append(watchFunc)
+        return
+    
+    def removeWatch(self, watchFunc):
+        if watchFunc in self.treeWatch:
+            self.treeWatch.remove(watchFunc)
+        return
+    
+    def notifyWatch(self, changedHandles):
+        if len(self.treeWatch) == 0: return
+        logger.verbose("BookTree: Notifying %d watcher(s) of %d change(s)",
+            len(self.treeWatch), len(changedHandles)
+        )
+        for watchFunc in self.treeWatch:
+            watchFunc(changedHandles)
+        return
+    
     #
     # Tree Item Maintenance
     #
     
     def updateItem(self, itemHandle, tTag, tValue):
-        self.theTree[self.treeLookup[itemHandle]]["entry"].setFromTag(tTag,tValue)
+        
+        bookEntry = self.theTree[self.treeLookup[itemHandle]].entry
+        if tTag in (BookItem.TAG_TYPE,BookItem.TAG_LEVEL) and self.unindexType(itemHandle,bookEntry):
+            bookEntry.setFromTag(tTag,tValue)
+            self.indexType(itemHandle,bookEntry)
+        else:
+            bookEntry.setFromTag(tTag,tValue)
+        self.markChanged([itemHandle])
+        
         return
     
     def getItem(self, itemHandle):
         return self.theTree[self.treeLookup[itemHandle]]
     
     def changeOrder(self, itemHandle, moveIt):
+        """Moves an entry up or down among its siblings, or moves a FILE entry to the previous or
+        next node. Only the sibling lists involved are changed, and the tree order is rebuilt the
+        next time it is needed. Returns True if the entry was moved."""
         
         treeItem   = self.getItem(itemHandle)
-        itemParent = treeItem["parent"]
-        itemEntry  = treeItem["entry"]
+        itemParent = treeItem.parent
+        itemEntry  = treeItem.entry
         
         if itemEntry.itemLevel == BookItem.LEV_FILE:
             currList = self.parOfFiles[itemParent]
@@ -185,72 +318,180 @@ class BookTree():
             currList = self.parOfItems[itemParent]
         else:
             logger.error("BookTree: Cannot change order of ROOT elements")
-            return
+            return False
         
         if moveIt not in self.validOrder:
             logger.error("BUG: Unknown ordering requested")
-            return
+            return False
         
         if itemHandle not in currList:
             logger.error("BUG: Cannot change order of %s, as it is not where it should be" % itemHandle)
-            return
+            return False
         
-        # If move withing parent, just swap the indices, and refresh the master index
+        # If move withing parent, just swap with the neighbouring sibling
         if moveIt == self.ORD_UP or moveIt == self.ORD_DOWN:
             
-            currIndex = currList.index(itemHandle)
-            
             if moveIt == self.ORD_UP:
-                newIndex = currIndex - 1
+                wasMoved = currList.moveUp(itemHandle)
             elif moveIt == self.ORD_DOWN:
-                newIndex = currIndex + 1
-            
-            if newIndex < 0 or newIndex >= len(currList): return
-            
-            currList[currIndex], currList[newIndex] = currList[newIndex], currList[currIndex]
+                wasMoved = currList.moveDown(itemHandle)
             
-            if itemEntry.itemLevel == BookItem.LEV_FILE:
-                self.parOfFiles[itemParent] = currList
-            elif itemEntry.itemLevel == BookItem.LEV_ITEM:
-                self.parOfItems[itemParent] = currList
-            
-            self.buildTreeOrder()
-            self.updateEntryOrder()
+            if not wasMoved: return False
+            self.orderValid = False
+            self.markChanged([itemHandle])
         
-        # If moving to a new node, update parent and set order to None
+        # If moving to a new node, the entry goes last in the node above, or first in the node
+        # below, so that its position in the tree order stays the same
         elif moveIt == self.ORD_NUP or moveIt == self.ORD_NDOWN:
             
             # This is only allowed for FILE entries
-            if itemEntry.itemLevel == BookItem.LEV_ITEM: return
+            if itemEntry.itemLevel == BookItem.LEV_ITEM: return False
             
-            treeParent = self.getItem(itemParent)
-            parParent  = treeParent["parent"]
-            parEntry   = treeParent["entry"]
+            parParent = self.getItem(itemParent).parent
             
             if parParent is not None:
-                # Move to next or previous node
+                # Move to next or previous node, or to the root node at either end
                 parList = self.parOfItems[parParent]
                 if itemParent not in parList:
                     logger.error("BUG: Something unexpected happened while moving entry")
-                    return
-                parIndex = parList.index(itemParent)
+                    return False
                 if moveIt == self.ORD_NUP:
-                    newIndex = parIndex - 1
+                    newParent = parList.getPrev(itemParent)
                 elif moveIt == self.ORD_NDOWN:
-                    newIndex = parIndex + 1
+                    newParent = parList.getNext(itemParent)
                 
-                if newIndex < 0 or newIndex >= len(parList):
-                    self.theTree[self.treeLookup[itemHandle]]["parent"] = parParent
-                    self.sortTree()
+                if newParent is None:
+                    self.moveItem(itemHandle,parParent)
                 else:
-                    self.theTree[self.treeLookup[itemHandle]]["parent"] = parList[newIndex]
-                    self.sortTree()
+                    self.moveItem(itemHandle,newParent,moveIt == self.ORD_NDOWN)
             else:
                 # Move to last child node
                 parList = self.parOfItems[itemParent]
-                self.theTree[self.treeLookup[itemHandle]]["parent"] = parList[len(parList)-1]
-                self.sortTree()
-            
+                if len(parList) == 0:
+                    logger.debug("BookTree: There is no node to move %s to" % itemHandle)
+                    return False
+                self.moveItem(itemHandle,parList.getLast(),True)
+        
+        return True
+    
+    def moveItem(self, itemHandle, pHandle, asFirst=False):
+        """Moves a FILE entry to a new parent, placing it either last or first among its new
+        siblings."""
+        
+        treeItem   = self.getItem(itemHandle)
+        itemParent = treeItem.parent
+        
+        if not treeItem.entry.itemLevel == BookItem.LEV_FILE:
+            logger.error("BookTree: Only FILE entries can be moved to another parent")
+            return
+        if pHandle not in self.parOfFiles.keys():
+            logger.error("BookTree: Cannot move %s to %s, which is not a node" % (itemHandle,pHandle))
+            return
+        
+        self.parOfFiles[itemParent].remove(itemHandle)
+        if asFirst:
+            self.parOfFiles[pHandle].prepend(itemHandle)
+        else:
+            self.parOfFiles[pHandle].append(itemHandle)
+        treeItem.parent = pHandle
+        self.orderValid = False
+        self.markChanged([itemHandle])
+        
+        logger.verbose("BookTree: Moved %s from %s to %s",itemHandle,itemParent,pHandle)
+        
+        return
+    
+    def deleteItem(self, itemHandle):
+        """Deletes an entry and everything below it from the tree. The slots in theTree are left
+        as None so that the positions in treeLookup stay valid, and are compacted away in batches.
+        The document files of the deleted entries are removed when the project is saved. Returns
+        the list of deleted handles."""
+        
+        treeItem = self.getItem(itemHandle)
+        if treeItem.entry.itemLevel == BookItem.LEV_ROOT:
+            logger.error("BookTree: Cannot delete ROOT elements")
+            return []
+        
+        # Collect the subtree, children first
+        delList = []
+        if itemHandle in self.parOfItems.keys():
+            for childHandle in self.parOfItems[itemHandle]:
+                delList += list(self.parOfFiles[childHandle]) + [childHandle]
+        if itemHandle in self.parOfFiles.keys():
+            delList += list(self.parOfFiles[itemHandle])
+        delList.append(itemHandle)
+        
+        logVerbose = logger.isVerbose()
+        delRefs    = set()
+        for delHandle in delList:
+            self.batchAdded.pop(delHandle,None)
+            delItem = self.getItem(delHandle)
+            if delItem.parent in self.parOfItems.keys() and delHandle in self.parOfItems[delItem.parent]:
+                self.parOfItems[delItem.parent].remove(delHandle)
+            if delItem.parent in self.parOfFiles.keys() and delHandle in self.parOfFiles[delItem.parent]:
+                self.parOfFiles[delItem.parent].remove(delHandle)
+            self.parOfItems.pop(delHandle,None)
+            self.parOfFiles.pop(delHandle,None)
+            self.unindexType(delHandle,delItem.entry)
+            if delItem.doc is not None:
+                self.purgeFiles.append(delItem.doc.docFile)
+                self.purgeFiles.append(delItem.doc.jrnlFile)
+                self.docCache.dropDoc(delItem.doc)
+            if delItem.entry.itemType in (BookItem.TYP_CHAR,BookItem.TYP_PLOT):
+                delRefs.add(delHandle)
+            self.theTree[self.treeLookup.pop(delHandle)] = None
+            self.deadCount += 1
+            if logVerbose: logger.verbose("BookTree: Deleted entry %s",delHandle)
+        
+        # Scenes can't point to characters or plots that no longer exist
+        if len(delRefs) > 0:
+            for treeItem in self.theTree:
+                if treeItem is None: continue
+                for refHandle in delRefs:
+                    treeItem.entry.removeSceneChar(refHandle)
+                    treeItem.entry.removeScenePlot(refHandle)
+        
+        self.orderValid = False
+        self.markChanged(delList)
+        if self.deadCount >= max(self.COMPACT_MIN,len(self.theTree)//4):
+            self.compactTree()
+        
+        logger.debug("BookTree: Deleted %d entries under %s" % (len(delList),itemHandle))
+        
+        return delList
+    
+    def compactTree(self):
+        """Removes the slots of deleted entries from theTree, and rebuilds treeLookup."""
+        
+        if self.deadCount == 0: return
+        
+        self.theTree    = [treeItem for treeItem in self.theTree if treeItem is not None]
+        self.treeLookup = {}
+        for itemIdx, treeItem in enumerate(self.theTree):
+            self.treeLookup[treeItem.handle] = itemIdx
+        
+        logger.debug("BookTree: Compacted %d deleted entries" % self.deadCount)
+        self.deadCount = 0
+        
+        return
+    
+    def purgeDeleted(self):
+        """Removes the document files of deleted entries from the project folder in one pass.
+        This is called after the project file is saved, so the saved project never points to
+        files that have been removed."""
+        
+        if self.docPath is None: return
+        
+        rmCount = 0
+        for docFile in self.purgeFiles:
+            docPath = path.join(self.docPath,docFile)
+            if path.isfile(docPath):
+                remove(docPath)
+                rmCount += 1
+        self.purgeFiles = []
+        
+        logger.debug("BookTree: Removed %d document file(s) of deleted entries" % rmCount)
+        
         return
     
     def createRootItem(self, rootType):
@@ -287,46 +528,87 @@ class BookTree():
         Appends an entry to the main project tree.
         """
         
-        tHandle = self.checkString(tHandle,self.makeHandle(),False)
+        tHandle = self.checkString(tHandle,None,False)
+        if tHandle is None:
+            tHandle = self.makeHandle()
         pHandle = self.checkString(pHandle,None,True)
         tOrder  = self.checkInt(tOrder,None,True)
         
-        logger.verbose("BookTree: Adding entry %s with parent %s" % (str(tHandle),str(pHandle)))
+        logger.verbose("BookTree: Adding entry %s with parent %s",tHandle,pHandle)
         
         if bookItem.itemLevel == BookItem.LEV_FILE:
-            docItem = DocFile(self.docPath,tHandle,bookItem.itemClass)
+            docItem = DocFile(self.docPath,tHandle,bookItem.itemClass,self.docCache,self.docCompress,self.docPack)
         else:
             docItem = None
         
-        self.theTree.append({
-            "handle" : tHandle,
-            "parent" : pHandle,
-            "order"  : tOrder,
-            "entry"  : bookItem,
-            "doc"    : docItem,
-        })
+        self.theTree.append(TreeNode(tHandle,pHandle,tOrder,bookItem,docItem))
         lastIdx = len(self.theTree)-1
         self.treeLookup[tHandle] = lastIdx
+        if self.batchDepth > 0:
+            self.batchAdded[tHandle] = True
+            self.batchDirty[tHandle] = True
+        
+        return tHandle
+    
+    def indexItem(self, tHandle):
+        """Adds a newly appended entry last among its siblings in the parent indices. The tree
+        order and the order parameter of the entries are rebuilt the next time they are needed.
+        A full rebuild of the indices is done by sortTree."""
+        
+        if self.placeItem(tHandle):
+            self.markChanged([tHandle])
+            return
+        
+        if self.batchDepth > 0:
+            logger.debug("BookTree: Cannot index %s in place, rebuilding the index after the batch" % tHandle)
+        else:
+            logger.warning("BookTree: Cannot index %s in place, rebuilding the index" % tHandle)
+        self.sortTree()
         
         return
     
+    def placeItem(self, tHandle):
+        """Appends an entry to the sibling list of its parent. Returns False if the parent is not
+        in the indices."""
+        
+        treeItem   = self.getItem(tHandle)
+        itemParent = treeItem.parent
+        itemLevel  = treeItem.entry.itemLevel
+        
+        if itemLevel == BookItem.LEV_ITEM and itemParent in self.parOfItems.keys():
+            self.parOfItems[itemParent].append(tHandle)
+            self.parOfFiles[tHandle] = SiblingList()
+        elif itemLevel == BookItem.LEV_FILE and itemParent in self.parOfFiles.keys():
+            self.parOfFiles[itemParent].append(tHandle)
+        else:
+            return False
+        
+        self.indexType(tHandle,treeItem.entry)
+        self.batchAdded.pop(tHandle,None)
+        self.orderValid = False
+        logger.verbose("BookTree: Entry %s indexed under %s",tHandle,itemParent)
+        
+        return True
+    
     def validateTree(self):
         
-        errCount = 0
+        errCount   = 0
+        logVerbose = logger.isVerbose()
         
         # Checking ROOT level
         for treeItem in self.theTree:
             
-            itemHandle = treeItem["handle"]
-            itemParent = treeItem["parent"]
-            bookEntry  = treeItem["entry"]
+            if treeItem is None: continue
+            itemHandle = treeItem.handle
+            itemParent = treeItem.parent
+            bookEntry  = treeItem.entry
             itemIdx    = self.treeLookup[itemHandle]
             
             if not bookEntry.itemLevel == BookItem.LEV_ROOT: continue
-            logger.verbose("BookTree: Checking ROOT with handle %s" % itemHandle)
+            if logVerbose: logger.verbose("BookTree: Checking ROOT with handle %s",itemHandle)
             
             if itemParent is not None:
-                self.theTree[itemIdx]["parent"] = None
+                self.theTree[itemIdx].parent = None
                 logger.warning("BookTree: Parent was set for ROOT element %s" % itemHandle)
                 errCount += 1
             
@@ -347,20 +629,21 @@ class BookTree():
         # Checking ITEM level
         for treeItem in self.theTree:
             
-            itemHandle = treeItem["handle"]
-            itemParent = treeItem["parent"]
-            bookEntry  = treeItem["entry"]
+            if treeItem is None: continue
+            itemHandle = treeItem.handle
+            itemParent = treeItem.parent
+            bookEntry  = treeItem.entry
             itemIdx    = self.treeLookup[itemHandle]
             hasError   = False
             
             if not bookEntry.itemLevel == BookItem.LEV_ITEM: continue
-            logger.verbose("BookTree: Checking ITEM with handle %s" % itemHandle)
+            if logVerbose: logger.verbose("BookTree: Checking ITEM with handle %s",itemHandle)
             
             for itemType in BookItem.validTypes:
                 if bookEntry.itemType == itemType:
                     if itemParent is None:
                         logger.warning("BookTree: Parent was missing for ITEM of type %s with handle %s" % (itemType,itemHandle))
-                        self.theTree[itemIdx]["parent"] = self.fixedItems[itemType]
+                        self.theTree[itemIdx].parent = self.fixedItems[itemType]
                         errCount += 1
         
         logger.info("BookTree: Found %d error(s) while parsing the project tree" % errCount)
@@ -369,33 +652,48 @@ class BookTree():
     
     def sortTree(self):
         
+        # Within a batch, the indices are rebuilt once when it ends
+        if self.batchDepth > 0:
+            self.sortQueued = True
+            return
+        
+        # Make sure the order parameters reflect any changes not yet applied
+        self.refreshOrder()
+        
         # Resetting Indices
         self.parOfItems = {}
         self.parOfFiles = {}
+        self.typeIndex  = {}
+        
+        logVVerbose = logger.isVVerbose()
         
         treeOrder = []
         logger.debug("TreeSort: Reading previous order")
         tempOrder = [None] * len(self.theTree)
         for treeItem in self.theTree:
-            itemHandle = treeItem["handle"]
-            itemOrder  = treeItem["order"]
-            itemName   = treeItem["entry"].itemName
+            if treeItem is None: continue
+            itemHandle = treeItem.handle
+            itemOrder  = treeItem.order
+            itemName   = treeItem.entry.itemName
             if itemOrder is not None and isinstance(itemOrder,int):
                 if tempOrder[itemOrder] is None:
                     tempOrder[itemOrder] = itemHandle
-                    logger.vverbose("TreeSort: Entry '%s' %s has order %s" % (
-                        str(itemName), str(itemHandle), str(itemOrder)
-                    ))
+                    if logVVerbose:
+                        logger.vverbose("TreeSort: Entry '%s' %s has order %s",
+                            itemName, itemHandle, itemOrder
+                        )
                 else:
                     tempOrder.append(itemHandle)
-                    logger.vverbose("TreeSort: Entry '%s' %s has no order, appending" % (
-                        str(itemName), str(itemHandle)
-                    ))
+                    if logVVerbose:
+                        logger.vverbose("TreeSort: Entry '%s' %s has no order, appending",
+                            itemName, itemHandle
+                        )
             else:
                 tempOrder.append(itemHandle)
-                logger.vverbose("TreeSort: Entry '%s' %s has no order, appending" % (
-                    str(itemName), str(itemHandle)
-                ))
+                if logVVerbose:
+                    logger.vverbose("TreeSort: Entry '%s' %s has no order, appending",
+                        itemName, itemHandle
+                    )
         for tempItem in tempOrder:
             if tempItem is not None: treeOrder.append(tempItem)
         
@@ -403,8 +701,9 @@ class BookTree():
         logger.debug("TreeSort: Sorting ROOT entries")
         for rootType in self.fixedOrder:
             itemHandle = self.fixedItems[rootType]
-            self.parOfItems[itemHandle] = []
-            self.parOfFiles[itemHandle] = []
+            self.parOfItems[itemHandle] = SiblingList()
+            self.parOfFiles[itemHandle] = SiblingList()
+            self.indexType(itemHandle,self.getItem(itemHandle).entry)
         
         # Scanning ITEM level
         logger.debug("TreeSort: Sorting ITEM entries")
@@ -413,18 +712,20 @@ class BookTree():
             itemIdx    = self.treeLookup[itemHandle]
             treeItem   = self.theTree[itemIdx]
             
-            itemHandle = treeItem["handle"]
-            itemParent = treeItem["parent"]
-            bookEntry  = treeItem["entry"]
+            itemHandle = treeItem.handle
+            itemParent = treeItem.parent
+            bookEntry  = treeItem.entry
             
             if not bookEntry.itemLevel == BookItem.LEV_ITEM: continue
             
             if itemParent in self.parOfItems.keys():
                 self.parOfItems[itemParent].append(itemHandle)
-                logger.vverbose("TreeSort: ITEM '%s' %s appended to %s" % (
-                    bookEntry.itemName, str(itemHandle), str(itemParent)
-                ))
-                self.parOfFiles[itemHandle] = []
+                self.indexType(itemHandle,bookEntry)
+                if logVVerbose:
+                    logger.vverbose("TreeSort: ITEM '%s' %s appended to %s",
+                        bookEntry.itemName, itemHandle, itemParent
+                    )
+                self.parOfFiles[itemHandle] = SiblingList()
             else:
                 logger.warning("BUG: itemParent %s not found in itemParent" % itemParent)
         
@@ -435,29 +736,41 @@ class BookTree():
             itemIdx    = self.treeLookup[itemHandle]
             treeItem   = self.theTree[itemIdx]
             
-            itemHandle = treeItem["handle"]
-            itemParent = treeItem["parent"]
-            bookEntry  = treeItem["entry"]
+            itemHandle = treeItem.handle
+            itemParent = treeItem.parent
+            bookEntry  = treeItem.entry
             
             if not bookEntry.itemLevel == BookItem.LEV_FILE: continue
             
             if itemParent in self.parOfFiles.keys():
                 self.parOfFiles[itemParent].append(itemHandle)
-                logger.vverbose("TreeSort: FILE '%s' %s appended to %s" % (
-                    bookEntry.itemName, str(itemHandle), str(itemParent)
-                ))
+                self.indexType(itemHandle,bookEntry)
+                if logVVerbose:
+                    logger.vverbose("TreeSort: FILE '%s' %s appended to %s",
+                        bookEntry.itemName, itemHandle, itemParent
+                    )
             else:
                 logger.warning("BUG: itemParent %s not found in fileParent" % itemParent)
         
         self.buildTreeOrder()
         self.updateEntryOrder()
+        self.batchAdded = {}
         
         return
     
+    def refreshOrder(self):
+        """Rebuilds the tree order and renumbers the order parameter of all entries, but only if
+        the tree has changed since the last time."""
+        if not self.orderValid:
+            self.buildTreeOrder()
+            self.updateEntryOrder()
+        return
+    
     def buildTreeOrder(self):
         
         # Resetting Indices
-        self.treeOrder = []
+        self.theOrder   = []
+        self.orderIndex = {}
         
         rootOrder = []
         itemOrder = []
@@ -481,35 +794,186 @@ class BookTree():
         
         errCount = 0
         logger.debug("TreeSort: Assempling index, and checking for consistency")
-        self.treeOrder = rootOrder + itemOrder + fileOrder
+        self.theOrder = rootOrder + itemOrder + fileOrder
+        for itemOrder, itemHandle in enumerate(self.theOrder):
+            self.orderIndex[itemHandle] = itemOrder
         for itemHandle in self.treeLookup.keys():
-            if itemHandle not in self.treeOrder:
+            if itemHandle not in self.orderIndex and itemHandle not in self.batchAdded:
                 logger.warning("BUG: Handle %s not in index" % itemHandle)
                 errCount += 1
         if errCount == 0:
             logger.debug("TreeSort: Index is consistent")
         else:
             logger.warning("BUG: %d errors found in the index" % errCount)
-            
-        uniqueSet = set(self.treeOrder)
-        if len(uniqueSet) == len(self.treeOrder):
+        
+        if len(self.orderIndex) == len(self.theOrder):
             logger.debug("TreeSort: No duplicates found in index")
-            
+        else:
+            logger.warning("BUG: %d duplicates found in index" % (
+                len(self.theOrder) - len(self.orderIndex)
+            ))
+        
         return
     
     def updateEntryOrder(self):
         
         logger.debug("TreeSort: Setting order parameter of tree entries")
-        for itemOrder in range(len(self.treeOrder)):
-            itemHandle = self.treeOrder[itemOrder]
-            itemIdx    = self.treeLookup[itemHandle]
-            self.theTree[itemIdx]["order"] = itemOrder
-            logger.vverbose("TreeSort: Setting '%s' %s to order %d" % (
-                str(self.theTree[itemIdx]["entry"].itemName), itemHandle, itemOrder
+        logVVerbose = logger.isVVerbose()
+        for itemHandle, itemOrder in self.orderIndex.items():
+            treeItem = self.theTree[self.treeLookup[itemHandle]]
+            treeItem.order = itemOrder
+            if logVVerbose:
+                logger.vverbose("TreeSort: Setting '%s' %s to order %d",
+                    treeItem.entry.itemName, itemHandle, itemOrder
+                )
+        self.orderValid = True
+        
+        return
+    
+    #
+    # Startup Cache
+    #
+    
+    def packTree(self):
+        """Returns the entries of the tree, with the values of their items, and the indices as
+        plain tuples, lists and dictionaries, so they can be written to the startup cache."""
+        
+        self.refreshOrder()
+        
+        tagAttrs  = tuple(BookItem.tagAttr.values())
+        entryList = []
+        for treeItem in self.theTree:
+            if treeItem is None: continue
+            bookEntry = treeItem.entry
+            entryList.append((
+                treeItem.handle, treeItem.parent, treeItem.order,
+                tuple(getattr(bookEntry,attrName) for attrName in tagAttrs),
+                list(bookEntry.sceneChars), list(bookEntry.scenePlots),
             ))
         
+        parItems = {}
+        for itemHandle in self.parOfItems.keys():
+            parItems[itemHandle] = list(self.parOfItems[itemHandle])
+        parFiles = {}
+        for itemHandle in self.parOfFiles.keys():
+            parFiles[itemHandle] = list(self.parOfFiles[itemHandle])
+        
+        return (entryList, parItems, parFiles, dict(self.fixedItems))
+    
+    def unpackTree(self, packedTree):
+        """Fills an empty tree from the output of packTree. The values were checked when they were
+        first read, so they are set on the items and the tree directly, and the tree is not sorted
+        again.
+        Raises ValueError if the indices don't cover all the entries."""
+        
+        entryList, parItems, parFiles, fixedItems = packedTree
+        
+        tagAttrs = tuple(BookItem.tagAttr.values())
+        for tHandle, pHandle, tOrder, tagValues, sceneChars, scenePlots in entryList:
+            bookItem = BookItem()
+            for attrName, attrValue in zip(tagAttrs,tagValues):
+                setattr(bookItem,attrName,attrValue)
+            bookItem.sceneChars = sceneChars
+            bookItem.scenePlots = scenePlots
+            if bookItem.itemLevel == BookItem.LEV_FILE:
+                docItem = DocFile(self.docPath,tHandle,bookItem.itemClass,self.docCache,self.docCompress,self.docPack)
+            else:
+                docItem = None
+            self.treeLookup[tHandle] = len(self.theTree)
+            self.theTree.append(TreeNode(tHandle,pHandle,tOrder,bookItem,docItem))
+        
+        self.parOfItems = {}
+        for itemHandle in parItems.keys():
+            self.parOfItems[itemHandle] = SiblingList(parItems[itemHandle])
+        self.parOfFiles = {}
+        for itemHandle in parFiles.keys():
+            self.parOfFiles[itemHandle] = SiblingList(parFiles[itemHandle])
+        for rootType in fixedItems.keys():
+            self.fixedItems[rootType] = fixedItems[rootType]
+        
+        self.typeIndex = {}
+        for treeItem in self.theTree:
+            self.indexType(treeItem.handle,treeItem.entry)
+        
+        self.buildTreeOrder()
+        if len(self.orderIndex) != len(self.treeLookup):
+            raise ValueError("Tree indices don't match the tree entries")
+        self.updateEntryOrder()
+        
         return
     
+    #
+    # Tree Queries
+    #
+    
+    def children(self, itemHandle):
+        """Returns the handles of the entries directly below an entry, in tree order."""
+        
+        childList = []
+        if itemHandle in self.parOfItems.keys():
+            childList += self.parOfItems[itemHandle]
+        if itemHandle in self.parOfFiles.keys():
+            childList += self.parOfFiles[itemHandle]
+        
+        return childList
+    
+    def descendants(self, itemHandle):
+        """Returns the handles of all the entries below an entry, in tree order. That is, the
+        ITEMs first, then the FILEs directly below the entry, then the FILEs below each ITEM."""
+        
+        descList = []
+        itemList = []
+        if itemHandle in self.parOfItems.keys():
+            itemList  = list(self.parOfItems[itemHandle])
+            descList += itemList
+        for parHandle in chain([itemHandle],itemList):
+            if parHandle in self.parOfFiles.keys():
+                descList += self.parOfFiles[parHandle]
+        
+        return descList
+    
+    def itemsOfType(self, itemType, itemLevel=None):
+        """Returns the handles of all entries of a given type, and optionally level, in tree
+        order. Only the matching entries are looked at."""
+        
+        if itemLevel is None:
+            typeKeys = [(itemType,tLevel) for tLevel in BookItem.validLevels]
+        else:
+            typeKeys = [(itemType,itemLevel)]
+        
+        typeList = []
+        for typeKey in typeKeys:
+            if typeKey in self.typeIndex.keys():
+                typeList += self.typeIndex[typeKey]
+        
+        if len(typeList) > 1:
+            self.refreshOrder()
+            typeList.sort(key=self.orderIndex.get)
+        
+        return typeList
+    
+    def scenesInCompileOrder(self, onlyCompile=False):
+        """Returns the handles of the scenes of the book in the order they are compiled. That is,
+        the FILEs in the prologue, chapter and epilogue ITEMs, in tree order. If onlyCompile is
+        set, chapters and scenes that are not set to be compiled are left out."""
+        
+        bookRoot = self.fixedItems[BookItem.TYP_BOOK]
+        if bookRoot not in self.parOfItems.keys(): return []
+        
+        sceneList = []
+        for chapHandle in self.parOfItems[bookRoot]:
+            chapEntry = self.getItem(chapHandle).entry
+            if chapEntry.itemSubType not in (BookItem.SUB_PRO,BookItem.SUB_CHAP,BookItem.SUB_EPI):
+                continue
+            if onlyCompile and not chapEntry.itemCompile:
+                continue
+            for sceneHandle in self.parOfFiles[chapHandle]:
+                if onlyCompile and not self.getItem(sceneHandle).entry.itemCompile:
+                    continue
+                sceneList.append(sceneHandle)
+        
+        return sceneList
+    
     #
     # Setters and Getters
     #
@@ -518,16 +982,62 @@ class BookTree():
         self.docPath = docPath
         return
     
+    def setCompression(self, docCompress):
+        """Sets the compression documents are written with. Existing files are converted the
+        next time they are saved."""
+        self.docCompress = docCompress
+        for treeItem in self.theTree:
+            if treeItem is not None and treeItem.doc is not None:
+                treeItem.doc.docCompress = docCompress
+        return
+    
+    def setPack(self, docPack):
+        """Sets the BookPack documents are read from, or None to use the document folder.
+        Must be called before the entries are added."""
+        self.docPack = docPack
+        return
+    
+    @property
+    def treeOrder(self):
+        """The handles of all entries in tree order, rebuilt first if the tree has changed."""
+        self.refreshOrder()
+        return self.theOrder
+    
+    def getOrder(self, itemHandle):
+        """Returns the position of an entry in the tree order, or None if it isn't indexed."""
+        self.refreshOrder()
+        if itemHandle in self.orderIndex:
+            return self.orderIndex[itemHandle]
+        return None
+    
     #
     # Internal Functions
     #
     
-    def makeHandle(self,seed=""):
-        itemHandle = sha256((str(time())+seed).encode()).hexdigest()[0:13]
-        if itemHandle in self.treeLookup.keys():
-            logger.warning("BookTree: Duplicate handle encountered! Retrying ...")
-            itemHandle = self.makeHandle(seed+"!")
-        return itemHandle
+    def makeHandle(self):
+        return self.handleGen.newHandle()
+    
+    def makeHandles(self, newCount):
+        """Reserves newCount handles in one go, for adding many entries at once."""
+        return self.handleGen.newHandles(newCount)
+    
+    def hasHandle(self, itemHandle):
+        return itemHandle in self.treeLookup
+    
+    def indexType(self, itemHandle, bookEntry):
+        typeKey = (bookEntry.itemType,bookEntry.itemLevel)
+        if typeKey not in self.typeIndex.keys():
+            self.typeIndex[typeKey] = {}
+        self.typeIndex[typeKey][itemHandle] = True
+        return
+    
+    def unindexType(self, itemHandle, bookEntry):
+        """Removes an entry from the type index. Returns False if it wasn't there."""
+        typeKey = (bookEntry.itemType,bookEntry.itemLevel)
+        if typeKey in self.typeIndex.keys() and itemHandle in self.typeIndex[typeKey]:
+            del self.typeIndex[typeKey][itemHandle]
+            return True
+        return False
     
     def checkString(self,checkValue,defaultValue,allowNone=False):
         if allowNone:
@@ -12,12 +12,9 @@
 
 import logging
 import nw
-import gi
-gi.require_version("Gtk","3.0")
 
-from gi.repository import Gtk, GdkPixbuf
-from os            import path
-from datetime      import datetime
+from os       import path
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +26,11 @@ def getTimeStamp(dateSep=""):
 
 def getIconWidget(iconID, iconSize=None):
     
+    # Only the GUI uses this, so Gtk is imported here to keep the rest of the module free of it
+    import gi
+    gi.require_version("Gtk","3.0")
+    from gi.repository import Gtk, GdkPixbuf
+    
     thmePath = path.join(nw.CONFIG.themePath,nw.CONFIG.theTheme)
     iconFile = "%s.svg" % iconID
     iconPath = path.join(thmePath,"icons",iconFile)
@@ -42,6 +42,7 @@ class GuiEditor(Gtk.Paned):
         self.noteLoaded  = False
         self.docChanged  = False
         self.noteChanged = False
+        self.autoChanged = False
         
         # Pane Between Document and Details/Notes
         self.set_name("panedEditor")
@@ -72,6 +73,8 @@ class GuiEditor(Gtk.Paned):
         
         # Signals
         self.editDoc.textBuffer.connect("changed",self.onDocChange)
+        if self.editNote is not None:
+            self.editNote.textBuffer.connect("changed",self.onNoteChange)
         self.editDoc.textView.connect("key-press-event",self.onKeyPress)
         
         return
@@ -80,6 +83,10 @@ class GuiEditor(Gtk.Paned):
         
         docEntry = self.treeItem["entry"]
         docItem  = self.treeItem["doc"]
+        
+        # Keep the text in memory for as long as the document is open in the editor
+        if not self.docLoaded:
+            self.theBook.pinDoc(self.itemHandle)
         docItem.openFile()
         
         self.editDoc.entryDocTitle.set_text(docEntry.getFromTag(docEntry.TAG_NAME))
@@ -94,16 +101,25 @@ class GuiEditor(Gtk.Paned):
         return
     
     def saveContent(self):
+        """Saves the document if the text, the notes or the title has changed since it was loaded
+        or last saved. Returns the number of bytes written."""
         
         docEntry   = self.treeItem["entry"]
         docItem    = self.treeItem["doc"]
+        docTitle   = self.editDoc.entryDocTitle.get_text().strip()
+        
+        if not (self.docChanged or self.noteChanged or docTitle != docEntry.itemName):
+            logger.debug("Document %s is unchanged, not saving it" % self.itemHandle)
+            return 0
         
         textBuffer = self.editDoc.textBuffer
         parText, textCount = textBuffer.encodeText()
         
-        docTitle = self.editDoc.entryDocTitle.get_text().strip()
-        docEntry.setCounts(textCount)
-        docEntry.setName(docTitle)
+        # Update the entry through the tree, so the project is flagged as changed
+        with self.theBook.batch():
+            for metaTag, metaValue in zip(BookItem.validMeta,textCount):
+                self.theBook.updateItem(self.itemHandle,metaTag,metaValue)
+            self.theBook.updateItem(self.itemHandle,BookItem.TAG_NAME,docTitle)
         
         if self.itemClass == BookItem.CLS_SCENE:
             noteBuffer = self.editNote.textBuffer
@@ -112,7 +128,11 @@ class GuiEditor(Gtk.Paned):
             parNote = []
         
         docItem.setText(parText,textCount,parNote)
-        docItem.saveFile()
+        byteCount = docItem.saveFile()
+        
+        self.docChanged  = False
+        self.noteChanged = False
+        self.autoChanged = False
         
         tabIcon = self.get_parent().get_tab_label(self).get_children()[0]
         tabIcon.set_from_icon_name("emblem-default-symbolic",Gtk.IconSize.MENU)
@@ -122,8 +142,29 @@ class GuiEditor(Gtk.Paned):
         tabLabel = self.get_parent().get_tab_label(self).get_children()[1]
         tabLabel.set_text(docTitle)
         
-        return
+        return byteCount
+    
+    def autoSaveContent(self):
+        """Writes the changes to the text and notes since the last autosave to the document's
+        journal, which is much cheaper than saving the whole document. The document is still
+        marked as changed, and the journal is written into the document on the next save.
+        Returns the number of bytes written."""
+        
+        if not self.autoChanged: return 0
+        
+        docItem = self.treeItem["doc"]
+        parText, textCount = self.editDoc.textBuffer.encodeText()
+        if self.itemClass == BookItem.CLS_SCENE:
+            parNote, noteCount = self.editNote.textBuffer.encodeText()
+        else:
+            parNote = []
         
+        docItem.setText(parText,textCount,parNote)
+        byteCount = docItem.saveJournal()
+        self.autoChanged = False
+        
+        return byteCount
+    
     def onKeyPress(self, guiObject, guiKeyEvent):
         
         # print(guiKeyEvent.state)
@@ -136,13 +177,27 @@ class GuiEditor(Gtk.Paned):
         
         if not self.docLoaded: return
         
-        self.docChanged = True
+        self.docChanged  = True
+        self.autoChanged = True
         
         tabIcon = self.get_parent().get_tab_label(self).get_children()[0]
         tabIcon.set_from_icon_name("emblem-important-symbolic",Gtk.IconSize.MENU)
         tabIconCol = Gdk.RGBA(red=0.75,green=0.0,blue=0.0,alpha=1.0).to_color()
         tabIcon.modify_fg(Gtk.StateType.NORMAL,tabIconCol)
         
+        return
+    
+    def onNoteChange(self, guiObject):
+        
+        if not self.noteLoaded: return
+        
+        self.noteChanged = True
+        self.autoChanged = True
+        
+        tabIcon = self.get_parent().get_tab_label(self).get_children()[0]
+        tabIcon.set_from_icon_name("emblem-important-symbolic",Gtk.IconSize.MENU)
+        tabIconCol = Gdk.RGBA(red=0.75,green=0.0,blue=0.0,alpha=1.0).to_color()
+        tabIcon.modify_fg(Gtk.StateType.NORMAL,tabIconCol)
         
         return
     
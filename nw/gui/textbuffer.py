@@ -16,6 +16,8 @@ import gi
 gi.require_version("GtkSource","3.0")
 
 from gi.repository import GtkSource, Pango
+from nw.stats      import countText
+from nw.codec      import escapeText, decodePar
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +47,17 @@ class NWTextBuffer(GtkSource.Buffer):
             "del"    : ["nwStrike", self.tagStrike],
         }
         
+        # Encoded lines from the last encoding, and the lines being edited
+        self.parCache  = None
+        self.editLines = None
+        
+        self.connect("insert-text",self.onInsertText)
+        self.connect_after("insert-text",self.onTextChanged)
+        self.connect("delete-range",self.onDeleteRange)
+        self.connect_after("delete-range",self.onTextChanged)
+        self.connect("apply-tag",self.onTagChange)
+        self.connect("remove-tag",self.onTagChange)
+        
         return
     
     def getCursorIter(self):
@@ -79,215 +92,285 @@ class NWTextBuffer(GtkSource.Buffer):
         
         return
     
+    #
+    # Track Changes
+    #
+    
+    def onInsertText(self, theBuffer, itPos, theText, textLen):
+        """Runs before text is inserted, and notes the line it goes into."""
+        if self.parCache is not None:
+            self.editLines = (itPos.get_line(),itPos.get_line(),self.get_line_count())
+        return
+    
+    def onDeleteRange(self, theBuffer, itStart, itEnd):
+        """Runs before text is deleted, and notes the lines it spans."""
+        if self.parCache is not None:
+            self.editLines = (itStart.get_line(),itEnd.get_line(),self.get_line_count())
+        return
+    
+    def onTextChanged(self, theBuffer, *theArgs):
+        """Runs after text has been inserted or deleted. The noted lines are replaced in the
+        cache by as many cleared lines as they have become, which keeps the cache of the lines
+        after them in line with the buffer. With CRLF line ends, the paragraph of the next line
+        starts within the edited line, so it is cleared too.
+        """
+        
+        if self.parCache is None or self.editLines is None:
+            return
+        
+        firstLine, lastLine, prevCount = self.editLines
+        self.editLines = None
+        if len(self.parCache) != prevCount:
+            self.parCache = None
+            return
+        
+        newCount = lastLine - firstLine + 1 + self.get_line_count() - prevCount
+        self.parCache[firstLine:lastLine+1] = [None]*newCount
+        if firstLine+newCount < len(self.parCache):
+            self.parCache[firstLine+newCount] = None
+        
+        return
+    
+    def onTagChange(self, theBuffer, theTag, itStart, itEnd):
+        """Runs when a tag is applied or removed, and clears the lines of the range in the cache,
+        and the line after it for the same reason as above.
+        """
+        
+        if self.parCache is None or not theTag.get_property("name") in self.mapEnc.keys():
+            return
+        
+        for lineIdx in range(itStart.get_line(),min(itEnd.get_line()+2,len(self.parCache))):
+            self.parCache[lineIdx] = None
+        
+        return
+    
     #
     # Encode and Decode the Buffer
     #
     
     def encodeText(self, getBounds=None):
+        """Encodes the buffer, or the range getBounds, as a list of html-formatted strings, one
+        per line, and counts them with countText. The whole buffer is encoded
+        one line at a time, and each line is kept in parCache along with its counts and the tags
+        open at its start and its end. Edits clear the lines they touch, so the next call only
+        encodes those lines again, and the lines after them for as long as the tags open at
+        their start differ from what was cached. The rest is taken from the cache.
+        """
         
         logger.verbose("Beginning encoding of text buffer")
         
-        if getBounds is None:
-            itStart, itEnd = self.get_bounds()
-        else:
+        if getBounds is not None:
             itStart, itEnd = getBounds
+            parText   = self.encodeRange(itStart,itEnd,[],True)
+            textCount = countText(parText)
+            logger.verbose("Encoded range with %d paragraphs, %d sentences, %d words and %d characters",
+                *textCount
+            )
+            return parText, textCount
         
-        parText   = []
-        textCount = [0,0,0]
-        
-        tagState = {}
-        for tagKey in self.mapEnc.keys():
-            tagState[tagKey] = False
+        lineCount = self.get_line_count()
+        if self.parCache is None or len(self.parCache) != lineCount:
+            self.parCache = [None]*lineCount
         
-        parBuffer = ""
+        parText   = []
+        textCount = [0,0,0,0]
         tagStack  = []
-        itCurr    = itStart.copy()
-        while True:
-            # If a new tag is started, add the tag state to the stack
-            # and insert the html tag.
-            if itCurr.starts_tag():
-                for startTag in itCurr.get_tags():
-                    tagName = startTag.get_property("name")
-                    if not tagName in self.mapEnc.keys():
-                        logger.vverbose("Skipping non-nw tag in buffer")
-                        continue
-                    tagHtml = self.mapEnc[tagName][0]
-                    if not tagName in tagStack:
-                        tagStack.append(tagName)
-                        parBuffer += "<%s>" % tagHtml
-                        logger.vverbose("Tags += %-8s : [%s]" % (tagName,", ".join(tagStack)))
-            
-            # Iterate through all opened tags in reverse order, and check if
-            # they have been closed. If so, add the html close tag and pop
-            # the tag from the stack
-            revStack = tagStack.copy()
-            for tagName in reversed(revStack):
-                if itCurr.ends_tag(self.mapEnc[tagName][1]):
-                    tagHtml = self.mapEnc[tagName][0]
-                    parBuffer += "</%s>" % tagHtml
-                    if tagName in tagStack:
-                        tagStack.remove(tagName)
-                        logger.vverbose("Tags -= %-8s : [%s]" % (tagName,", ".join(tagStack)))
-            revStack = []
-            
-            char = itCurr.get_char()
-            if char == "<": char = "&lt;"
-            if char == ">": char = "&gt;"
-            parBuffer += char
-            
-            # If at the end of a line, close all open tags, save the buffer
-            # as a new paragraph, reset the buffer and re-open all tags in
-            # the stack
-            if itCurr.ends_line() or itCurr.is_end():
-                textCount[0] += 1
-                parBuffer = parBuffer.rstrip("\n")
-                if len(tagStack) > 0:
-                    for tagName in reversed(tagStack):
-                        tagHtml = self.mapEnc[tagName][0]
-                        parBuffer += "</%s>" % tagHtml
-                parText.append(parBuffer)
-                
-                parBuffer = ""
-                if len(tagStack) > 0:
-                    for tagName in tagStack:
-                        tagHtml = self.mapEnc[tagName][0]
-                        parBuffer += "<%s>" % tagHtml
-            
-            if itCurr.ends_sentence(): textCount[1] += 1
-            if itCurr.ends_word():     textCount[2] += 1
-            
-            if itCurr.is_end():
-                break
-            else:
-                itCurr.forward_char()
+        newCount  = 0
+        for lineIdx in range(lineCount):
+            lineCache = self.parCache[lineIdx]
+            if lineCache is None or lineCache[0] != tagStack:
+                lineCache = self.encodeLine(lineIdx,tagStack)
+                self.parCache[lineIdx] = lineCache
+                newCount += 1
+            parText.append(lineCache[1])
+            textCount = [a+b for a, b in zip(textCount,lineCache[3])]
+            tagStack  = lineCache[2]
         
-        logger.verbose("Length of tag stack is %d" % len(tagStack))
-        logger.verbose("Encoded buffer with %d paragraphs, %d sentences and %d words" % (
-            tuple(textCount)
-        ))
+        logger.verbose("Encoded %d of %d lines, the rest were cached",newCount,lineCount)
+        logger.verbose("Length of tag stack is %d",len(tagStack))
+        logger.verbose("Encoded buffer with %d paragraphs, %d sentences, %d words and %d characters",
+            *textCount
+        )
         
         return parText, textCount
     
     def decodeText(self, parText):
-        """Decodes a list of html-formatted strings into the buffer.
+        """Decodes a list of html-formatted strings into the buffer, replacing its content.
+        All paragraphs are decoded first with decodePar, into the plain text and a list of the
+        ranges each tag covers. The text is then put in the buffer with a single call, and each
+        range tagged.
         ToDo: Add functionality to insert text instead of just replacing the buffer
         """
         
         logger.verbose("Beginning decoding of text buffer")
         
-        validOpen  = []
-        validClose = []
-        for nwTag in self.mapDec.keys():
-            validOpen.append("<%s>" % nwTag)
-            validClose.append("</%s>" % nwTag)
+        textParts = []
+        tagRanges = {}
+        textPos   = 0
         
-        # Disable undo, and clear the buffer
+        # Each paragraph is decoded into runs of text with the same styles, and each run is
+        # added to the range of each of its tags, extending the last range where they meet
+        for parIdx, parItem in enumerate(parText):
+            
+            if parIdx > 0:
+                textParts.append("\n")
+                textPos += 1
+            
+            for runText, runStyle in decodePar(parItem):
+                textParts.append(runText)
+                runEnd = textPos + len(runText)
+                for styleName in runStyle:
+                    tagList = tagRanges.setdefault(self.mapDec[styleName][0],[])
+                    if len(tagList) > 0 and tagList[-1][1] == textPos:
+                        tagList[-1][1] = runEnd
+                    else:
+                        tagList.append([textPos,runEnd])
+                textPos = runEnd
+        
+        # Disable undo, replace the text of the buffer, and apply the tags. The cache is
+        # dropped first, so the changes are not tracked.
+        self.parCache  = None
+        self.editLines = None
         self.set_max_undo_levels(0)
-        itStart, itEnd = self.get_bounds()
-        self.delete(itStart,itEnd)
+        self.set_text("".join(textParts))
+        for tagName in tagRanges.keys():
+            theTag = self.mapEnc[tagName][1]
+            for tagStart, tagEnd in tagRanges[tagName]:
+                self.apply_tag(theTag,self.get_iter_at_offset(tagStart),self.get_iter_at_offset(tagEnd))
+        
+        # Enable the undo buffer again
+        self.set_max_undo_levels(100)
+        logger.verbose("Decoded %d paragraphs with %d tagged ranges",
+            len(parText),sum(len(tagList) for tagList in tagRanges.values())
+        )
         
-        parCount = 0
-        tagStack = []
+        return
+    
+    #
+    # Internal Functions
+    #
+    
+    def encodeLine(self, lineIdx, stackIn):
+        """Encodes the paragraph of line lineIdx, given the tags open at its start, and returns
+        its entry for parCache: the tags open at the start, the paragraph, the tags open at the
+        end, and its counts. A paragraph runs from right after the line end of the line before
+        it, up to and including its own line end, which is where the encoder of the whole buffer
+        splits paragraphs.
+        """
+        
+        itEnd = self.get_iter_at_line(lineIdx)
+        if not itEnd.ends_line():
+            itEnd.forward_to_line_end()
+        if lineIdx > 0:
+            itStart = self.get_iter_at_line(lineIdx-1)
+            if not itStart.ends_line():
+                itStart.forward_to_line_end()
+            itStart.forward_char()
+        else:
+            itStart = self.get_start_iter()
         
-        # Iterate through all paragraps
-        for parItem in parText:
+        # The line end itself is encoded too, as the whole buffer encoder does, so unless this
+        # is the last line, the range goes one past it
+        tagStack = list(stackIn)
+        if itEnd.is_end():
+            parText = self.encodeRange(itStart,itEnd,tagStack,True)
+        else:
+            itNext = itEnd.copy()
+            itNext.forward_char()
+            parText = self.encodeRange(itStart,itNext,tagStack,False)
+        
+        return (list(stackIn),parText[0],tagStack,countText(parText))
+    
+    def encodeRange(self, itStart, itEnd, tagStack, atEnd):
+        """Encodes the text from itStart up to itEnd as a list of paragraphs. The tagStack holds
+        the tags open at the start, and is left holding those open at the end. If atEnd, itEnd
+        is handled as the end of the text, where open tags are closed and the last paragraph
+        ends. If not, the range must end right after a line end.
+        Rather than checking every character, the encoder only stops where one of the nw tags is
+        toggled and where a line ends, and copies the text in between in one piece. The result
+        is the same as checking each character in turn: at a stop, tags that start there are
+        opened, then tags that end there are closed, and each paragraph closes the tags still
+        open at its end and opens them again at the start of the next one.
+        """
+        
+        logVVerbose = logger.isVVerbose()
+        
+        startOffset = itStart.get_offset()
+        endOffset   = itEnd.get_offset()
+        rangeText   = self.get_slice(itStart,itEnd,True)
+        
+        # Find where the nw tags are toggled within the range. The start is included so that
+        # tags already open there are opened, and the end so that tags ending there are closed.
+        tagStops = {startOffset}
+        if atEnd:
+            tagStops.add(endOffset)
+        for tagName in self.mapEnc.keys():
+            itTag = itStart.copy()
+            while itTag.forward_to_tag_toggle(self.mapEnc[tagName][1]):
+                if itTag.get_offset() >= endOffset: break
+                tagStops.add(itTag.get_offset())
+        
+        # Find where the lines end. The end of the text always ends a paragraph.
+        lineStops = set()
+        if atEnd:
+            lineStops.add(endOffset)
+        itLine = itStart.copy()
+        while True:
+            if not itLine.ends_line():
+                itLine.forward_to_line_end()
+            if itLine.is_end() or itLine.get_offset() >= endOffset: break
+            lineStops.add(itLine.get_offset())
+            itLine.forward_char()
+        
+        parText   = []
+        parBuffer = ["<%s>" % self.mapEnc[tagName][0] for tagName in tagStack]
+        runStart  = startOffset
+        for theStop in sorted(tagStops | lineStops):
             
-            # First, iterate through the paragraph looking for html formatting
-            # tags, and add them to the stack as a list of strings where each
-            # string is either a format tag,  or a string which has the same
-            # formatting.
-            parStack  = []
-            stackItem = ""
-            for char in parItem:
-                if char == "<":
-                    parStack.append(stackItem)
-                    stackItem = char
-                elif char == ">":
-                    parStack.append(stackItem+char)
-                    stackItem = ""
-                else:
-                    stackItem += char
-            parStack.append(stackItem)
+            # Nothing is toggled and no line ends between two stops, so the text between them
+            # is added as it is, apart from escaping
+            if theStop > runStart:
+                parBuffer.append(escapeText(rangeText[runStart-startOffset:theStop-startOffset]))
             
-            # Then, iterate through the strings in the stack, parsing each of
-            # them as either just a string to add to the buffer, or an action
-            # on the tag stack.
-            # Each string in the buffer will have the same formatting, and the
-            # current formatting at the given point in the buffer is given by
-            # the tagStack. Each time a new tag is encountered, it is added to
-            # the stack. Each time a closing tag is encountered, that tag is
-            # removed from the stack.
-            tagStack = []
-            for stackItem in parStack:
-                itemType = 0
-                if len(stackItem) > 2:
-                    if stackItem[0:2] == "</":
-                        itemType = 2
-                    elif stackItem[0] == "<":
-                        itemType = 1
+            if theStop in tagStops:
+                itCurr = self.get_iter_at_offset(theStop)
                 
-                # Opening a new tag: so adding it to the stack
-                # If the source is well formatted, the tag should not
-                # already be in the stack. But if it is, it is ignored.
-                # This serves the double purpose of cleaning up the buffer
-                # of tags opened multiple times without being closed.
-                if itemType == 1:
-                    if not stackItem in validOpen: continue
-                    tagHtml = stackItem[1:-1].lower()
-                    if not tagHtml in self.mapDec.keys():
-                        logger.warning("BUG: Some inconsistency in tag names, got %s" % tagHtml)
-                        continue
-                    tagName = self.mapDec[tagHtml][0]
-                    if not tagName in tagStack:
-                        tagStack.append(tagName)
-                        logger.vverbose("Tags += %-8s : [%s]" % (tagName,", ".join(tagStack)))
+                # If a new tag is started, add the tag state to the stack and insert the html
+                # tag. A tag can't start at the end of the range.
+                if theStop < endOffset:
+                    for startTag in itCurr.get_tags():
+                        tagName = startTag.get_property("name")
+                        if not tagName in self.mapEnc.keys():
+                            if logVVerbose: logger.vverbose("Skipping non-nw tag in buffer")
+                            continue
+                        if not tagName in tagStack:
+                            tagStack.append(tagName)
+                            parBuffer.append("<%s>" % self.mapEnc[tagName][0])
+                            if logVVerbose:
+                                logger.vverbose("Tags += %-8s : [%s]",tagName,", ".join(tagStack))
                 
-                # Closing a tag, so removing it from the stack
-                # If the source is well formatted, this should be the last
-                # tag, meaning the stack behaves like a proper stack. If it
-                # isn't in the stack, there is an orphaned close tag in the
-                # source, and it will be removed.
-                elif itemType == 2:
-                    if not stackItem in validClose: continue
-                    tagHtml = stackItem[2:-1].lower()
-                    if not tagHtml in self.mapDec.keys():
-                        logger.warning("BUG: Some inconsistency in tag names, got %s" % tagHtml)
-                        continue
-                    tagName = self.mapDec[tagHtml][0]
-                    if tagName in tagStack:
+                # Iterate through all opened tags in reverse order, and check if they have been
+                # closed. If so, add the html close tag and pop the tag from the stack.
+                for tagName in reversed(tagStack.copy()):
+                    if itCurr.ends_tag(self.mapEnc[tagName][1]):
+                        parBuffer.append("</%s>" % self.mapEnc[tagName][0])
                         tagStack.remove(tagName)
-                        logger.vverbose("Tags -= %-8s : [%s]" % (tagName,", ".join(tagStack)))
-                
-                # Anything that remeains, is plain text withing a range of
-                # uniform formatting. The correct formatting for the slice
-                # should then be defined by the tagStack. At this point there
-                # should be maximum one of each tag type.
-                else:
-                    itStart, itEnd = self.get_bounds()
-                    # We can now safely insert <> symbols again as we are no
-                    # longer parsing html style tags.
-                    stackItem = stackItem.replace("&lt;","<")
-                    stackItem = stackItem.replace("&gt;",">")
-                    # If the tagStack is empty, no need to apply anything. Just insert.
-                    if len(tagStack) == 0:
-                        self.insert(itEnd,stackItem)
-                    else:
-                        self.insert_with_tags_by_name(itEnd,stackItem,*tagStack)
-                    
-            parCount += 1
-            if parCount < len(parText):
-                itStart, itEnd = self.get_bounds()
-                self.insert(itEnd,"\n")
-        
-        # Enable the undo buffer again, and report the length of
-        # the tagStack. It should be 0 if all tags were properly closed.
-        self.set_max_undo_levels(100)
-        if len(tagStack) == 0:
-            errText = "all good"
-        else:
-            errText = "some tags were not properly closed"
-        logger.verbose("Length of tag stack is %d - %s" % (len(tagStack),errText))
+                        if logVVerbose:
+                            logger.vverbose("Tags -= %-8s : [%s]",tagName,", ".join(tagStack))
+            
+            if theStop < endOffset:
+                parBuffer.append(escapeText(rangeText[theStop-startOffset]))
+            runStart = theStop + 1
+            
+            # If at the end of a line, close all open tags, save the buffer as a new paragraph,
+            # reset the buffer and re-open all tags in the stack
+            if theStop in lineStops:
+                parItem = "".join(parBuffer).rstrip("\n")
+                for tagName in reversed(tagStack):
+                    parItem += "</%s>" % self.mapEnc[tagName][0]
+                parText.append(parItem)
+                parBuffer = ["<%s>" % self.mapEnc[tagName][0] for tagName in tagStack]
         
-        return
+        return parText
     
 # End Class NWTextBuffer
@@ -47,42 +47,33 @@ class GuiTimeLine(Gtk.Alignment):
         self.tblRows = []
         self.tblCols = []
         
+        theTree  = self.theBook.theTree
         tmpChars = []
         tmpPlots = []
         
-        for treeHandle in self.theBook.theTree.treeOrder:
-            
-            treeItem   = self.theBook.getItem(treeHandle)
-            
-            itemHandle = treeItem["handle"]
+        for itemHandle in theTree.itemsOfType(BookItem.TYP_CHAR,BookItem.LEV_ITEM):
+            tmpChars.append({
+                "handle" : itemHandle,
+                "name"   : self.theBook.getItem(itemHandle)["entry"].itemName,
+            })
+        
+        for itemHandle in theTree.itemsOfType(BookItem.TYP_PLOT,BookItem.LEV_ITEM):
+            tmpPlots.append({
+                "handle" : itemHandle,
+                "name"   : self.theBook.getItem(itemHandle)["entry"].itemName,
+            })
+        
+        for itemHandle in theTree.scenesInCompileOrder():
+            treeItem   = self.theBook.getItem(itemHandle)
             itemParent = treeItem["parent"]
-            itemLevel  = treeItem["entry"].itemLevel
-            itemClass  = treeItem["entry"].itemClass
-            itemType   = treeItem["entry"].itemType
-            
-            if itemLevel == BookItem.LEV_ITEM:
-                if itemType == BookItem.TYP_CHAR:
-                    tmpChars.append({
-                        "handle" : itemHandle,
-                        "name"   : treeItem["entry"].itemName,
-                    })
-                elif itemType == BookItem.TYP_PLOT:
-                    tmpPlots.append({
-                        "handle" : itemHandle,
-                        "name"   : treeItem["entry"].itemName,
-                    })
-            elif itemLevel == BookItem.LEV_FILE:
-                if itemType == BookItem.TYP_BOOK:
-                    treeParent  = self.theBook.getItem(itemParent)
-                    itemSubType = treeParent["entry"].itemSubType
-                    if itemSubType in (BookItem.SUB_PRO,BookItem.SUB_CHAP,BookItem.SUB_EPI):
-                        self.tblCols.append({
-                            "handle"    : itemHandle,
-                            "name"      : treeItem["entry"].itemName,
-                            "parhandle" : itemParent,
-                            "partype"   : treeParent["entry"].itemSubType,
-                            "parnum"    : treeParent["entry"].itemNumber,
-                        })
+            treeParent = self.theBook.getItem(itemParent)
+            self.tblCols.append({
+                "handle"    : itemHandle,
+                "name"      : treeItem["entry"].itemName,
+                "parhandle" : itemParent,
+                "partype"   : treeParent["entry"].itemSubType,
+                "parnum"    : treeParent["entry"].itemNumber,
+            })
         
         self.tblRows = tmpChars+tmpPlots
         self.buildGrid()
@@ -112,9 +103,11 @@ class GuiTimeLine(Gtk.Alignment):
             
             parHandle = colItem["parhandle"]
             
+            # Scenes are listed in tree order, so each chapter's scenes are contiguous
             if not colItem["parhandle"] == currChap:
                 currChap = colItem["parhandle"]
                 scnCount = 1
+                chapOrder.append(parHandle)
             else:
                 scnCount += 1
             
@@ -124,8 +117,6 @@ class GuiTimeLine(Gtk.Alignment):
             colNum += 1
             
             chapCount[parHandle] = scnCount
-            if parHandle not in chapOrder:
-                chapOrder.append(parHandle)
             if colItem["partype"] == BookItem.SUB_CHAP:
                 chapName[parHandle] = "%s %d" % (colItem["partype"],colItem["parnum"])
             else:
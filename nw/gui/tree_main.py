@@ -17,6 +17,7 @@ gi.require_version("Gtk","3.0")
 
 from gi.repository import Gtk, Pango
 from nw.file.item  import BookItem
+from nw.file.tree  import BookTree
 from nw.functions  import encodeString
 
 logger = logging.getLogger(__name__)
@@ -91,6 +92,9 @@ class GuiMainTree(Gtk.TreeView):
         self.menuContext.append(self.menuItemMoveScene)
         # menuItem.show()
         
+        # Reload when entries are added to or deleted from the project
+        self.theBook.addWatch(self.onTreeChange)
+        
         return
     
     def loadContent(self):
@@ -107,6 +111,7 @@ class GuiMainTree(Gtk.TreeView):
         # Make unselectable and clear
         self.treeSelect.set_mode(Gtk.SelectionMode.NONE)
         self.treeStore.clear()
+        self.iterMap = {}
         
         for treeHandle in self.theBook.theTree.treeOrder:
             
@@ -160,13 +165,44 @@ class GuiMainTree(Gtk.TreeView):
         self.treeSelect.set_mode(Gtk.SelectionMode.SINGLE)
         
         # Restore selected item state
-        if selHandle is not None:
+        if selHandle is not None and selHandle in self.iterMap:
             newIter = self.getIter(selHandle)
             self.treeSelect.select_iter(newIter)
         
         return
     
+    def onTreeChange(self, changedHandles):
+        """Called once for each change, or batch of changes, to the project tree. The view is
+        only reloaded if entries were added or deleted. Other changes are made to the rows
+        directly by the functions that make them."""
+        
+        for itemHandle in changedHandles:
+            if (itemHandle in self.iterMap) != self.theBook.theTree.hasHandle(itemHandle):
+                self.loadContent()
+                return
+        
+        return
+    
     def getIter(self, itemHandle):
         return self.iterMap[itemHandle]
     
+    def moveItem(self, itemHandle, moveIt):
+        """Swaps a row with the sibling above or below it, the same way BookTree.changeOrder
+        does, so the view doesn't need to be reloaded."""
+        
+        if itemHandle not in self.iterMap: return
+        
+        currIter = self.iterMap[itemHandle]
+        if moveIt == BookTree.ORD_UP:
+            swapIter = self.treeStore.iter_previous(currIter)
+        elif moveIt == BookTree.ORD_DOWN:
+            swapIter = self.treeStore.iter_next(currIter)
+        else:
+            return
+        
+        if swapIter is not None:
+            self.treeStore.swap(currIter,swapIter)
+        
+        return
+    
 # End Class GuiMainTree
@@ -16,6 +16,8 @@ import gi
 gi.require_version("Gtk","3.0")
 
 from gi.repository import Gtk
+from nw.file.item  import BookItem
+from nw.file.tree  import BookTree
 from nw.functions  import encodeString
 
 logger = logging.getLogger(__name__)
@@ -79,6 +81,9 @@ class GuiPlotsTree(Gtk.TreeView):
         self.append_column(self.colImport)
         self.append_column(self.colComment)
         
+        # Reload when entries are added to or deleted from the project
+        self.theBook.addWatch(self.onTreeChange)
+        
         return
     
     def loadContent(self):
@@ -95,8 +100,9 @@ class GuiPlotsTree(Gtk.TreeView):
         # Make unselectable and clear
         self.treeSelect.set_mode(Gtk.SelectionMode.NONE)
         self.listStore.clear()
+        self.iterMap = {}
         
-        for treeHandle in self.theBook.theTree.treeOrder:
+        for treeHandle in self.theBook.theTree.itemsOfType(BookItem.TYP_PLOT,BookItem.LEV_ITEM):
             
             treeItem   = self.theBook.getItem(treeHandle)
             
@@ -109,8 +115,6 @@ class GuiPlotsTree(Gtk.TreeView):
             itemType   = treeItem["entry"].itemType
             
             if not itemClass == "CONTAINER": continue
-            if not itemLevel == "ITEM":      continue
-            if not itemType  == "PLOT":      continue
             
             logger.vverbose("GUI: Adding %s '%s'" % (itemLevel,itemName))
             
@@ -128,13 +132,50 @@ class GuiPlotsTree(Gtk.TreeView):
         self.treeSelect.set_mode(Gtk.SelectionMode.SINGLE)
         
         # Restore selected item state
-        if selHandle is not None:
+        if selHandle is not None and selHandle in self.iterMap:
             newIter = self.getIter(selHandle)
             self.treeSelect.select_iter(newIter)
         
         return
     
+    def onTreeChange(self, changedHandles):
+        """Called once for each change, or batch of changes, to the project tree. The view is
+        only reloaded if one of its rows was deleted, or if a row should be added. Other changes
+        are made to the rows directly by the functions that make them."""
+        
+        for itemHandle in changedHandles:
+            if itemHandle in self.iterMap:
+                if not self.theBook.theTree.hasHandle(itemHandle):
+                    self.loadContent()
+                    return
+            elif self.theBook.theTree.hasHandle(itemHandle):
+                itemEntry = self.theBook.getItem(itemHandle)["entry"]
+                if itemEntry.itemType == BookItem.TYP_PLOT and itemEntry.itemLevel == BookItem.LEV_ITEM:
+                    self.loadContent()
+                    return
+        
+        return
+    
     def getIter(self, itemHandle):
         return self.iterMap[itemHandle]
     
+    def moveItem(self, itemHandle, moveIt):
+        """Swaps a row with the sibling above or below it, the same way BookTree.changeOrder
+        does, so the view doesn't need to be reloaded."""
+        
+        if itemHandle not in self.iterMap: return
+        
+        currIter = self.iterMap[itemHandle]
+        if moveIt == BookTree.ORD_UP:
+            swapIter = self.listStore.iter_previous(currIter)
+        elif moveIt == BookTree.ORD_DOWN:
+            swapIter = self.listStore.iter_next(currIter)
+        else:
+            return
+        
+        if swapIter is not None:
+            self.listStore.swap(currIter,swapIter)
+        
+        return
+    
 # End Class GuiCharsTree
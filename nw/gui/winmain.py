@@ -328,6 +328,12 @@ class GuiWinMain(Gtk.ApplicationWindow):
         
         pageID = self.nbContent.page_num(self.editPages[itemHandle]["item"])
         
+        # Changes that were autosaved to the journal are written into the document, unless the
+        # entry has been deleted, in which case its files are removed when the project is saved
+        docItem = self.editPages[itemHandle]["item"].treeItem["doc"]
+        if itemHandle in self.theBook.theTree.treeLookup and docItem.hasJournal():
+            docItem.saveFile()
+        
         posEdit = self.editPages[itemHandle]["item"].get_position()
         posMeta = self.editPages[itemHandle]["item"].panedMeta.get_position()
         
@@ -339,6 +345,7 @@ class GuiWinMain(Gtk.ApplicationWindow):
         
         self.nbContent.remove_page(pageID)
         del self.editPages[itemHandle]
+        self.theBook.unpinDoc(itemHandle)
         
         return
     
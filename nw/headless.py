@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*
+"""novelWriter Headless Class
+
+ novelWriter – Headless Class
+==============================
+ Runs batch commands on a project without the GUI
+
+ File History:
+ Created: 2017-11-10 [0.4.0]
+
+"""
+
+import logging
+import nw
+
+from os       import path, listdir, remove
+from nw.file  import Book, BookItem, DocFile
+from nw.codec import plainText
+
+logger = logging.getLogger(__name__)
+
+class NovelHeadless():
+    
+    def __init__(self, confPath):
+        """Loads projects through Book, BookTree and DocFile only. Nothing in here, or in the
+        modules it imports, may import Gtk, so the commands can run on a machine without a
+        display. Each command prints its result to standard output, and returns the exit code
+        of the program."""
+        
+        # Define Core Objects
+        self.mainConf = nw.CONFIG
+        self.mainConf.setConfPath(confPath)
+        self.mainConf.setGUIState(False)
+        self.theBook  = Book()
+        
+        # Command name, function and number of arguments after the project
+        self.theCommands = {
+            "stats"    : (self.cmdStats,   0),
+            "validate" : (self.cmdValidate,0),
+            "export"   : (self.cmdExport,  1),
+            "reindex"  : (self.cmdReindex, 0),
+            "recount"  : (self.cmdRecount, 0),
+        }
+        
+        return
+    
+    def runCommand(self, cmdName, cmdArgs):
+        """Opens the project given as the first argument, runs the command on it, and closes
+        it again. Returns 2 if the command or its arguments are not valid, and 1 if the project
+        could not be opened."""
+        
+        if cmdName not in self.theCommands.keys():
+            logger.error("Headless: Unknown command '%s'" % cmdName)
+            return 2
+        
+        cmdFunc, argCount = self.theCommands[cmdName]
+        if len(cmdArgs) != argCount+1:
+            logger.error("Headless: Command '%s' takes a project and %d more argument(s)" % (
+                cmdName,argCount
+            ))
+            return 2
+        
+        logger.info("Headless: Running command '%s' on %s" % (cmdName,cmdArgs[0]))
+        self.theBook.openBook(cmdArgs[0])
+        if not self.theBook.bookLoaded:
+            return 1
+        
+        try:
+            exitCode = cmdFunc(*cmdArgs[1:])
+        finally:
+            self.theBook.closeBook()
+        
+        return exitCode
+    
+    #
+    # Commands
+    #
+    
+    def cmdStats(self):
+        """Prints the number of documents of each type, and the sum of their counts as stored
+        in the project file."""
+        
+        theTree = self.theBook.theTree
+        print("Title:   %s" % self.theBook.bookTitle)
+        print("Authors: %s" % ", ".join(self.theBook.bookAuthors))
+        print("Entries: %d" % len(theTree.treeLookup))
+        print("")
+        print("%-6s %8s %10s %10s %10s %10s" % ("Type","Files","Pars","Sents","Words","Chars"))
+        
+        allSums = [0,0,0,0,0]
+        for itemType in BookItem.validTypes:
+            typeSums = [0,0,0,0,0]
+            for itemHandle in theTree.itemsOfType(itemType,BookItem.LEV_FILE):
+                itemEntry    = theTree.getItem(itemHandle).entry
+                typeSums[0] += 1
+                for n, metaTag in enumerate(BookItem.validMeta):
+                    metaValue = itemEntry.getFromTag(metaTag)
+                    if metaValue is not None:
+                        typeSums[n+1] += metaValue
+            print("%-6s %8d %10d %10d %10d %10d" % (itemType,*typeSums))
+            allSums = [a+b for a, b in zip(allSums,typeSums)]
+        print("%-6s %8d %10d %10d %10d %10d" % ("Total",*allSums))
+        
+        return 0
+    
+    def cmdValidate(self):
+        """Checks the tree and every document file without changing anything, and prints what
+        it finds. Returns 1 if there are errors. Warnings, like a document that has never been
+        saved, or a file that doesn't belong to any entry, don't fail the check."""
+        
+        theTree  = self.theBook.theTree
+        theErrs  = []
+        theWarns = []
+        docFiles = set()
+        
+        for itemHandle in theTree.treeOrder:
+            treeItem  = theTree.getItem(itemHandle)
+            itemEntry = treeItem.entry
+            if itemEntry.itemLevel != BookItem.LEV_ROOT and treeItem.parent not in theTree.treeLookup:
+                theErrs.append("Entry %s has an unknown parent %s" % (itemHandle,treeItem.parent))
+            if itemEntry.itemClass is None or itemEntry.itemType is None:
+                theErrs.append("Entry %s has no class or type" % itemHandle)
+            
+            docItem = treeItem.doc
+            if docItem is None: continue
+            docFiles.add(docItem.docFile)
+            docFiles.add(docItem.jrnlFile)
+            try:
+                if not docItem.readFile(docItem.emptyText()):
+                    theWarns.append("Document %s has no valid file" % itemHandle)
+            except Exception as e:
+                theErrs.append("Document %s could not be read: %s" % (itemHandle,str(e)))
+            if docItem.hasJournal():
+                theWarns.append("Document %s has changes in a journal that are not saved" % itemHandle)
+        
+        for fileName in self.listDocFiles():
+            if fileName in docFiles: continue
+            if fileName.endswith("~"):
+                theWarns.append("File %s is left over from an interrupted save" % fileName)
+            else:
+                theWarns.append("File %s doesn't belong to any entry" % fileName)
+        
+        for errText in theErrs:
+            print("ERROR:   %s" % errText)
+        for warnText in theWarns:
+            print("WARNING: %s" % warnText)
+        print("Checked %d entries, found %d error(s) and %d warning(s)" % (
+            len(theTree.treeLookup),len(theErrs),len(theWarns)
+        ))
+        
+        return 1 if len(theErrs) > 0 else 0
+    
+    def cmdExport(self, outPath):
+        """Writes the scenes that are set to be compiled, in compile order, to a plain text
+        file, with a heading for each chapter and a break between scenes."""
+        
+        theTree  = self.theBook.theTree
+        outLines = [self.theBook.bookTitle,""]
+        parChap  = None
+        for sceneHandle in theTree.scenesInCompileOrder(onlyCompile=True):
+            treeItem = theTree.getItem(sceneHandle)
+            if treeItem.parent != parChap:
+                parChap = treeItem.parent
+                outLines += ["",theTree.getItem(parChap).entry.itemName or "",""]
+            else:
+                outLines += ["","* * *",""]
+            for parText in treeItem.doc.docText[DocFile.VAL_TEXT]:
+                outLines.append(plainText(parText))
+        
+        with open(outPath,"w",encoding="utf-8") as outFile:
+            charCount = outFile.write("\n".join(outLines)+"\n")
+        print("Wrote %d characters to %s" % (charCount,outPath))
+        
+        return 0
+    
+    def cmdReindex(self):
+        """Throws away the startup cache, and parses the project file again to rebuild the
+        tree, its indices and the cache."""
+        
+        if self.theBook.bookPack is not None:
+            logger.error("Headless: Packed projects have no index to rebuild")
+            return 1
+        
+        bookPath  = self.theBook.bookPath
+        cachePath = self.theBook.theCache.getCachePath()
+        self.theBook.closeBook()
+        if path.isfile(cachePath):
+            remove(cachePath)
+        
+        self.theBook.openBook(bookPath)
+        if not self.theBook.bookLoaded:
+            return 1
+        print("Indexed %d entries" % len(self.theBook.theTree.treeLookup))
+        
+        return 0
+    
+    def cmdRecount(self):
+        """Counts the text of every document again, and saves the project file if any of the
+        counts stored in it have changed."""
+        
+        if self.theBook.bookPack is not None:
+            logger.error("Headless: Packed projects are read only, unpack the project to recount it")
+            return 1
+        
+        docCount = self.theBook.recountDocs()
+        if self.theBook.bookChanged:
+            self.theBook.saveBook()
+            print("Counted %d documents, and saved the new counts" % docCount)
+        else:
+            print("Counted %d documents, all counts were up to date" % docCount)
+        
+        return 0
+    
+    #
+    # Internal Functions
+    #
+    
+    def listDocFiles(self):
+        bookPack = self.theBook.bookPack
+        if bookPack is not None:
+            return [fileName for fileName in bookPack.packIndex.keys() if fileName != bookPack.bookFile]
+        docPath = self.theBook.docPath
+        if docPath is None or not path.isdir(docPath):
+            return []
+        return listdir(docPath)
+    
+# End Class NovelHeadless
@@ -16,7 +16,7 @@ import nw
 import gi
 gi.require_version("Gtk","3.0")
 
-from gi.repository        import Gtk, Gdk
+from gi.repository        import Gtk, Gdk, GLib
 from time                 import sleep
 from os                   import path
 from nw.gui.winmain       import GuiWinMain
@@ -119,6 +119,10 @@ class NovelWriter():
         self.plotPage.treePlots.rendImport.connect("edited",self.onPlotEdit,"importance")
         self.plotPage.treePlots.rendComment.connect("edited",self.onPlotEdit,"comment")
         
+        # Autosave
+        if self.mainConf.autoSave > 0:
+            GLib.timeout_add_seconds(self.mainConf.autoSave,self.onAutoSave)
+        
         # Load Data from Last Project
         self.openBook(None,True)
         
@@ -168,10 +172,21 @@ class NovelWriter():
         self.theBook.setTitle(self.bookPage.entryBookTitle.get_text())
         self.theBook.setAuthors(self.bookPage.entryBookAuthor.get_text())
         
+        docBytes = 0
+        docCount = 0
         for itemHandle in self.winMain.editPages.keys():
-            self.winMain.editPages[itemHandle]["item"].saveContent()
-        
-        self.theBook.saveBook()
+            saveBytes = self.winMain.editPages[itemHandle]["item"].saveContent()
+            if saveBytes > 0:
+                docBytes += saveBytes
+                docCount += 1
+        
+        # Documents whose journal was replayed, but which haven't been edited since, still need
+        # their journal written into the document file
+        self.theBook.saveJournals()
+        bookBytes = self.theBook.saveBook()
+        logger.info("BookSave: Wrote %d bytes to %d document(s) and %d bytes to the project file" % (
+            docBytes,docCount,bookBytes
+        ))
         self.mainConf.setLastBook(self.theBook.bookPath)
         
         self.winMain.treeLeft.loadContent()
@@ -198,6 +213,29 @@ class NovelWriter():
         
         return
     
+    def removeItem(self, itemHandle):
+        """Deletes an entry and everything in it from the project after asking the user, and
+        closes any open tabs of the deleted documents. The document files themselves are removed
+        when the project is saved."""
+        
+        itemName   = self.theBook.getItem(itemHandle)["entry"].itemName
+        dlgConfirm = Gtk.MessageDialog(
+            self.winMain,0,Gtk.MessageType.QUESTION,Gtk.ButtonsType.YES_NO,
+            "Delete '%s' and everything in it?" % itemName
+        )
+        dlgReturn = dlgConfirm.run()
+        dlgConfirm.destroy()
+        if not dlgReturn == Gtk.ResponseType.YES:
+            logger.verbose("Action: Delete cancelled")
+            return
+        
+        delHandles = self.theBook.deleteItem(itemHandle)
+        for delHandle in delHandles:
+            if delHandle in self.winMain.editPages.keys():
+                self.winMain.onCloseTab(None,delHandle)
+        
+        return
+    
     ##                  ##
     #   Event Handlers   #
     #  ================  #
@@ -278,7 +316,7 @@ class NovelWriter():
             itemHandle = listModel.get_value(listIter,GuiMainTree.COL_HANDLE)
             itemName   = listModel.get_value(listIter,GuiMainTree.COL_NAME)
             logger.vverbose("Action: Selected item %s named '%s'" % (itemHandle,itemName))
-            
+        
         if itemHandle == None: return
         
         itemEntry = self.theBook.getItem(itemHandle)
@@ -331,7 +369,20 @@ class NovelWriter():
         if itemHandle == None: return
         
         logger.debug("Action: Moving file %s %s" % (itemHandle,moveIt))
-        self.theBook.changeOrder(itemHandle,moveIt)
+        if not self.theBook.changeOrder(itemHandle,moveIt): return
+        
+        # Moving within the parent only swaps two rows, so the views are updated in place
+        if moveIt == BookTree.ORD_UP or moveIt == BookTree.ORD_DOWN:
+            itemEntry = self.theBook.getItem(itemHandle)["entry"]
+            self.winMain.treeLeft.moveItem(itemHandle,moveIt)
+            if itemEntry.itemLevel == BookItem.LEV_ITEM:
+                if itemEntry.itemType == BookItem.TYP_BOOK:
+                    self.winMain.bookPage.treeChapters.moveItem(itemHandle,moveIt)
+                elif itemEntry.itemType == BookItem.TYP_CHAR:
+                    self.winMain.charPage.treeChars.moveItem(itemHandle,moveIt)
+                elif itemEntry.itemType == BookItem.TYP_PLOT:
+                    self.winMain.plotPage.treePlots.moveItem(itemHandle,moveIt)
+            return
         
         self.winMain.treeLeft.loadContent()
         self.winMain.bookPage.treeChapters.loadContent()
@@ -357,7 +408,6 @@ class NovelWriter():
         if itemHandle == None: return
         
         self.theBook.addFile(itemHandle)
-        self.winMain.treeLeft.loadContent()
         
         return
     
@@ -387,8 +437,6 @@ class NovelWriter():
         
         logger.vverbose("Action: User clicked add chapter")
         self.theBook.addChapter()
-        self.winMain.treeLeft.loadContent()
-        self.bookPage.treeChapters.loadContent()
         
         return
     
@@ -396,6 +444,17 @@ class NovelWriter():
         
         logger.vverbose("Action: User clicked remove chapter")
         
+        itemHandle = None
+        
+        listModel, pathList = self.winMain.bookPage.treeChapters.treeSelect.get_selected_rows()
+        for pathItem in pathList:
+            listIter   = listModel.get_iter(pathItem)
+            itemHandle = listModel.get_value(listIter,GuiChaptersTree.COL_HANDLE)
+        
+        if itemHandle == None: return
+        
+        self.removeItem(itemHandle)
+        
         return
     
     def onChapterMove(self, guiObject, moveIt):
@@ -410,10 +469,10 @@ class NovelWriter():
         if itemHandle == None: return
         
         logger.debug("Action: Moving chapter %s %s" % (itemHandle,moveIt))
-        self.theBook.changeOrder(itemHandle,moveIt)
+        if not self.theBook.changeOrder(itemHandle,moveIt): return
         
-        self.winMain.treeLeft.loadContent()
-        self.winMain.bookPage.treeChapters.loadContent()
+        self.winMain.treeLeft.moveItem(itemHandle,moveIt)
+        self.winMain.bookPage.treeChapters.moveItem(itemHandle,moveIt)
         
         return
     
@@ -459,8 +518,6 @@ class NovelWriter():
         
         logger.vverbose("Event: User clicked add character")
         self.theBook.addCharacter()
-        self.winMain.treeLeft.loadContent()
-        self.charPage.treeChars.loadContent()
         
         return
     
@@ -468,6 +525,17 @@ class NovelWriter():
         
         logger.vverbose("Event: User clicked remove character")
         
+        itemHandle = None
+        
+        listModel, pathList = self.winMain.charPage.treeChars.treeSelect.get_selected_rows()
+        for pathItem in pathList:
+            listIter   = listModel.get_iter(pathItem)
+            itemHandle = listModel.get_value(listIter,GuiCharsTree.COL_HANDLE)
+        
+        if itemHandle == None: return
+        
+        self.removeItem(itemHandle)
+        
         return
     
     def onCharMove(self, guiObject, moveIt):
@@ -482,13 +550,10 @@ class NovelWriter():
         if itemHandle == None: return
         
         logger.debug("Action: Moving character %s %s" % (itemHandle,moveIt))
-        self.theBook.changeOrder(itemHandle,moveIt)
+        if not self.theBook.changeOrder(itemHandle,moveIt): return
         
-        self.winMain.treeLeft.loadContent()
-        self.winMain.charPage.treeChars.loadContent()
-        
-        newIter = self.winMain.charPage.treeChars.getIter(itemHandle)
-        self.winMain.charPage.treeChars.treeSelect.select_iter(newIter)
+        self.winMain.treeLeft.moveItem(itemHandle,moveIt)
+        self.winMain.charPage.treeChars.moveItem(itemHandle,moveIt)
         
         return
     
@@ -518,8 +583,6 @@ class NovelWriter():
         
         logger.vverbose("Event: User clicked add plot")
         self.theBook.addPlot()
-        self.winMain.treeLeft.loadContent()
-        self.plotPage.treePlots.loadContent()
         
         return
     
@@ -527,6 +590,17 @@ class NovelWriter():
         
         logger.vverbose("Event: User clicked remove plot")
         
+        itemHandle = None
+        
+        listModel, pathList = self.winMain.plotPage.treePlots.treeSelect.get_selected_rows()
+        for pathItem in pathList:
+            listIter   = listModel.get_iter(pathItem)
+            itemHandle = listModel.get_value(listIter,GuiPlotsTree.COL_HANDLE)
+        
+        if itemHandle == None: return
+        
+        self.removeItem(itemHandle)
+        
         return
     
     def onPlotMove(self, guiObject, moveIt):
@@ -541,13 +615,10 @@ class NovelWriter():
         if itemHandle == None: return
         
         logger.debug("Action: Moving plot %s %s" % (itemHandle,moveIt))
-        self.theBook.changeOrder(itemHandle,moveIt)
-        
-        self.winMain.treeLeft.loadContent()
-        self.winMain.plotPage.treePlots.loadContent()
+        if not self.theBook.changeOrder(itemHandle,moveIt): return
         
-        newIter = self.winMain.plotPage.treePlots.getIter(itemHandle)
-        self.winMain.plotPage.treePlots.treeSelect.select_iter(newIter)
+        self.winMain.treeLeft.moveItem(itemHandle,moveIt)
+        self.winMain.plotPage.treePlots.moveItem(itemHandle,moveIt)
         
         return
     
@@ -581,7 +652,21 @@ class NovelWriter():
     def onMainWinChange(self, guiObject, guiEvent):
         # self.mainConf.setWinSize(guiEvent.width,guiEvent.height)
         return
-
+    
+    def onAutoSave(self):
+        """Autosaves the open documents to their journals, and the config. Returns True so the
+        timer keeps running."""
+        
+        autoBytes = 0
+        for itemHandle in self.winMain.editPages.keys():
+            autoBytes += self.winMain.editPages[itemHandle]["item"].autoSaveContent()
+        if autoBytes > 0:
+            logger.debug("Autosave: Wrote %d bytes to document journals" % autoBytes)
+        
+        self.mainConf.onAutoSave()
+        
+        return True
+    
     def onApplicationQuit(self, guiObject, guiEvent):
         
         logger.info("Event: Shutting down")
@@ -598,10 +683,13 @@ class NovelWriter():
         self.mainConf.setPanePosition(posOuter,self.mainConf.PANE_MAIN)
         self.mainConf.setPanePosition(posContent,self.mainConf.PANE_CONT)
         
+        # Changes that were autosaved to journals are written into their documents
+        self.theBook.saveJournals()
+        
         self.mainConf.saveConfig()
         logger.debug("GUI: Calling Gtk quit")
         Gtk.main_quit()
         
         return
-
+    
 # End Class NovelWriter
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*
+"""novelWriter Text Statistics
+
+ novelWriter – Text Statistics
+===============================
+ Counts paragraphs, sentences, words and characters in stored text
+
+ File History:
+ Created: 2017-11-12 [0.4.0]
+
+"""
+
+import logging
+import re
+import nw
+
+from nw.codec import plainText
+
+logger = logging.getLogger(__name__)
+
+# A word is a run of characters without spaces holding at least one letter or digit. Words are
+# counted by splitting at spaces, less the runs that match this, which all follow a space.
+reNoWord = re.compile(r"\s[^\s\w]+(?=\s|$)")
+
+# A sentence ends with one or more of .!? and any closing quotes or brackets, followed by a
+# space or the end of the text, and at the end of each paragraph. Paragraphs are joined by an
+# empty line for this, so that the first line break is always followed by a space. Only text
+# that has a letter or digit in it counts as a sentence.
+reSentEnd  = re.compile(r"[.!?\n][.!?]*[\"'”’»)\]]*(?=\s|$)")
+reWordChar = re.compile(r"\w")
+
+def countText(parText):
+    """
+    Counts the paragraphs, sentences, words and characters in a list of paragraphs as they
+    are stored in the document files, and returns them in the order of BookItem.validMeta.
+    The tags are dropped, so only the text is counted. Characters are counted with spaces,
+    but without line breaks. All paragraphs are counted in one go, but as sentences and words
+    never run past the end of a paragraph, counting them one by one adds up to the same.
+    """
+    
+    if len(parText) == 0:
+        return [0,0,0,0]
+    
+    parPlain = plainText("\n\n".join(parText))
+    
+    sentCount = 0
+    for sentText in reSentEnd.split(parPlain):
+        if reWordChar.search(sentText) is not None:
+            sentCount += 1
+    
+    return [
+        len(parText),
+        sentCount,
+        len(parPlain.split()) - len(reNoWord.findall(" "+parPlain)),
+        len(parPlain) - 2*(len(parText)-1),
+    ]